@@ -12,7 +12,8 @@ In the crontab file, direct output of the cronjob to that result, e.g.:
     */10 * * * * sudo python /home/corona/flask_main.py -g > /dev/pts/0
 """
 
-import os, md5, subprocess, sys, collections
+import os, md5, subprocess, sys, collections, threading, multiprocessing, multiprocessing.pool, fcntl, re, time
+import multiprocessing.connection, signal, Queue
 IS_MAC = ( sys.platform=='darwin' )
 
 # Not used in this file, but simplifies import in later modules
@@ -25,12 +26,17 @@ app = flask.Flask( __name__ )
 
 import web_grab
 import web_graphline
+import web_leaders
+import web_popular
+import web_plotcache
 import web_stacker as stacker
 import util3                # After other imports so Matplotlib backend loaded already
 
 __VERSION__ = '3.7'
 
 LEFT_TIME = 45              # Plots will look back 45 days. Could be parameter someday.
+MAX_LEADERS = 1000          # Most rows one /leaders request may return
+MAX_STATUS_WAIT = 25        # Seconds a /plot_status request may wait for its job
 
 DEFAULT_SERVER_PORT = 5035 if IS_MAC else 80
 JINJA_ENV = jinja2.Environment( loader=jinja2.FileSystemLoader( "templates" ) )
@@ -38,10 +44,13 @@ JINJA_ENV = jinja2.Environment( loader=jinja2.FileSystemLoader( "templates" ) )
 # A few web and Flask-related parameters that are really constants.
 HOME_HREF = '/'         # Of course, but helpful to define as constant
 HOW_TO_READ_HREF = "/how-to-read.html"
+PLOT_STATUS_HREF = "/plot_status"
+DATA_HREF = "/data"
 YAML_INPUT_DIRPATH = 'yaml-input'
 YAML_OUTPUT_DIRPATH = 'yaml-output'
 STATIC_HREF0   = '/static'
-STATIC_DIRPATH = 'static'
+# Absolute, like < web_grab.SUPERDIR_PATH >, since cron runs -g from any directory.
+STATIC_DIRPATH = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'static' )
 
 # These constants are used in HTML/Javascript
 SEP = '~'
@@ -93,9 +102,73 @@ def about(): return JINJA_ENV.get_template( "about.html" ).render(base({}))
 
 @app.route("/rabidbatbitesbear")
 def grab_web_data():
+    generation = web_grab.Snapshots.generation()
     all_ok = web_grab.check_for_new_web_sources()
+    web_leaders.build_leaderboard( LEFT_TIME )
+    if web_grab.Snapshots.generation() != generation:
+        PREWARMER.start()
     return '<html><body>%s. <a href="%s">Home</a></body></html>' % ("OK" if all_ok else "Error", HOME_HREF)
 
+@app.route("/leaders")
+def leaders():
+    # Fastest- (or slowest-) growing geos, as JSON, from the leaderboard built at ingest.
+    # E.g. /leaders?series=cases_NYT&level=county&state=Texas&n=20&min_daily=10
+    # < sort > is one of daily, pct_raw, pct_smooth (default) or doubling_days.
+    args = flask.request.args
+    n = args.get( 'n', 50, type=int )
+    if not 1 <= n <= MAX_LEADERS:
+        return flask.jsonify( error='n must be from 1 to %d' % MAX_LEADERS ), 400
+    try:
+        rows = web_leaders.LEADERS.query( series=args.get( 'series' ),
+                                          level=args.get( 'level' ),
+                                          nation=args.get( 'nation' ),
+                                          state=args.get( 'state' ),
+                                          min_daily=args.get( 'min_daily', None, type=float ),
+                                          sort=args.get( 'sort', 'pct_smooth' ),
+                                          ascending=args.get( 'order', 'desc' )=='asc',
+                                          n=n )
+    except ValueError as e:
+        return flask.jsonify( error=str( e ) ), 400
+    return flask.jsonify( leaders=rows )
+
+@app.route( PLOT_STATUS_HREF )
+def plot_status():
+    # State of a background plot: queued, running, done or failed; with < figure_href >
+    # once done.  Waits up to < wait > seconds for the job to finish before answering.
+    # E.g. /plot_status?job=200518.093000-0123456789abcdef0123456789abcdef&wait=20
+    job_id = flask.request.args.get( 'job', '' )
+    wait = min( flask.request.args.get( 'wait', 0, type=float ), MAX_STATUS_WAIT )
+    state = JOBS.state( job_id, wait )
+    if state is None:
+        return flask.jsonify( state='unknown' ), 404
+    if state == RenderJob.DONE:
+        return flask.jsonify( state=state, figure_href=RenderJobs.Paths( job_id )[1] )
+    return flask.jsonify( state=state )
+
+@app.route("/plot_cache")
+def plot_cache():
+    # Size of the cache of plot images, as of its last collection, and this server's hit rate.
+    return flask.jsonify( PLOT_CACHE.report() )
+
+@app.route( DATA_HREF )
+def data():
+    # The numbers behind a plot, as JSON: each geo's layer pcts, its raw, smoothed and 
+    # extrapolated daily series, and the pct axis; see < web_stacker.Stacklist.as_data >.
+    # Takes the same arguments as /make_plots.
+    # Built by < RENDERER >, as an image is, so a slow fit holds no server thread for
+    # longer than its timeout.
+    series_name, geo_specs = plot_args()
+    if series_name not in web_grab.Series.Name2Instance or not geo_specs:
+        return flask.jsonify( error='Need a known series and at least one geo' ), 400
+    places = encode_places( '', series_name, geo_specs )
+    if RENDERER.started():
+        ok, answer = RENDERER.call( build_data, places )
+        if not ok:
+            return flask.jsonify( error='Could not build the data' ), 503
+    else:
+        answer = build_data( places, stack_workers=1 )  # No pool forked from a server thread
+    return flask.jsonify( answer )
+
 @app.route("/make_plots")
 def make_plots():
     # Extract parameters from a web request and then call plotting routine.
@@ -103,7 +176,20 @@ def make_plots():
     # Note that this scheme omits the date.
     # Did it this way so that a page may be bookmarked once and then revisited
     # daily, each time providing the plot for the last set of data.
-    
+    # With view=client the browser draws the plot, from /data, instead.
+    series_name, geo_specs = plot_args()
+
+    if not geo_specs:
+        return JINJA_ENV.get_template( "empty-message.html" ).render(base({}))
+
+    if flask.request.args.get( 'view' ) == 'client':
+        return JINJA_ENV.get_template( "plot_client.html" ).render(base({ 
+            'DATA_HREF': DATA_HREF + '?' + flask.request.query_string,
+            'GEO_NAMES': [ ', '.join( filter(None,geo_spec)[::-1] ) for geo_spec in geo_specs ]
+            }))
+    return plot( None, series_name, geo_specs )
+
+def plot_args():
     # Extract < series_name > parameter from request-args, e.g. cases_NYT
     series_name = flask.request.args.get( SERIES_NAME_PARM )
 
@@ -111,47 +197,52 @@ def make_plots():
     # Uses < series_name > as a filter to decide which checkboxes to heed.
     geo_specs = [ tuple( key.split(SEP)[1:] )
                   for key in flask.request.args.keys() 
-                  if (key != SERIES_NAME_PARM) and key.startswith( series_name ) ]
-
-    if not geo_specs:
-        return JINJA_ENV.get_template( "empty-message.html" ).render(base({}))
-
+                  if series_name and (key != SERIES_NAME_PARM) and key.startswith( series_name ) ]
     geo_specs.sort()
-    return plot( None, series_name, geo_specs )
+    return series_name, geo_specs
 
 def plot( pathname, series_name, geo_specs ):
-    # Generate the filename of the image's path.
+    series_version, digest, pathname, figure_href = plot_paths( series_name, geo_specs )
+    # Counted, so that < PREWARMER > can draw the popular plots of the next snapshot.
+    web_popular.POPULAR.record( encode_places( '', series_name, geo_specs ) )
+
+    # Build the image only if it doesn't already exist on disk.  It is drawn in the
+    # background; the page asks < plot_status > when it is ready.
+    job_id = None
+    if not PLOT_CACHE.lookup( pathname ):
+        #build_image( series_name, geo_specs, pathname )
+        job_id = JOBS.submit( series_version + RenderJobs.id_sep + digest, 
+                              pathname, encode_places( pathname, series_name, geo_specs ) )
+
+    return JINJA_ENV.get_template( "plot_host.html" ).render(base({ 
+        'PARMNAME': series_name,
+        'FIGURE_HREF': figure_href,
+        'JOB_ID': job_id,
+        'PLOT_STATUS_HREF': PLOT_STATUS_HREF,
+        'MAX_STATUS_WAIT': MAX_STATUS_WAIT,
+        'GEO_NAMES': [ ', '.join( filter(None,geo_spec)[::-1] ) 
+                       for geo_spec in geo_specs ]
+        }))
+
+def plot_paths( series_name, geo_specs ):
+    # Returns ( series_version, digest, pathname, figure_href ) of the plot's image.
     # The filename has to encapsulate all parameters needed to draw the plot, other
     # than the version of the series that is being used (that is in directory-name).
     # For now, this means only the geo-specs.  Someday may include < left_time >.
     m = md5.new()
     m.update( series_name + '/'.join([','.join(geospec) for geospec in geo_specs]) )
-    filename = m.hexdigest() + '.png'
 
-    # Generate the directory name of the image's path on disk (and URL).
+    # The directory of the image's path on disk (and URL) names the series version.
     series = web_grab.Series.GetSeries( series_name )
     series_version = series.timedname( compact=True )
-    output_dirpath = os.path.join( STATIC_DIRPATH, series_version )
+    pathname, figure_href = PLOT_CACHE.paths( series_version, m.hexdigest() )
+    output_dirpath = os.path.dirname( pathname )
     if not os.path.isdir( output_dirpath ):
-        os.makedirs( output_dirpath )
-
-    figure_href = os.path.join( STATIC_HREF0, series_version, filename )
-    pathname = os.path.join( output_dirpath, filename )
-
-    # Build the image only if it doesn't already exist on disk.
-    if not os.path.isfile( pathname ):
-        #build_image( series_name, geo_specs, pathname )
-        script = os.path.abspath( __file__ )
-        #pathname = os.path.abspath( pathname )
-        call = [ 'python', script, '-b', encode_places( pathname, series_name, geo_specs ) ]
-        subprocess.call( call )
-
-    return JINJA_ENV.get_template( "plot_host.html" ).render(base({ 
-        'PARMNAME': series_name,
-        'FIGURE_HREF': figure_href,
-        'GEO_NAMES': [ ', '.join( filter(None,geo_spec)[::-1] ) 
-                       for geo_spec in geo_specs ]
-        }))
+        try:
+            os.makedirs( output_dirpath )
+        except OSError:
+            pass                # Made meanwhile by another request
+    return series_version, m.hexdigest(), pathname, figure_href
 
 # Entry point for -b command
 def build_image( pathname, series_name, geo_specs, open_plot=False ):
@@ -159,18 +250,344 @@ def build_image( pathname, series_name, geo_specs, open_plot=False ):
     # Returned pathname will be < pathname > if supplied, else concocted from time.
     print 'Building image for', encode_places( pathname, series_name, geo_specs )
     series = web_grab.Series.GetSeries( series_name )
-    sergeos = [ web_graphline.SerGeo( filter( None, geo_spec )[-1],   # geo name
-                                      series.get_df( geo_spec ),      # pandas dataframe
-                                      series_name,
-                                      LEFT_TIME )
-                for geo_spec in geo_specs ]
+    # Loading and fitting run per geo, in parallel with --stack-workers; drawing runs here.
+    stacks = stacker.map_geos( build_geostack, [ ( series_name, geo_spec ) for geo_spec in geo_specs ] )
     dataset_when = series.timedname( alpha=True )
-    fig_rel_path = stacker.stackerX( sergeos, series_name, dataset_when, pathname )
+    fig_rel_path = stacker.stacker_of_stacks( stacks, series_name, dataset_when, pathname )
     print 'Wrote plot to', fig_rel_path
+    print 'Frame cache:', web_grab.Series.Frames
+    print 'Fit cache:', web_graphline.FITS
     if open_plot:
         subprocess.call( ['open', fig_rel_path ] )
     return fig_rel_path
 
+def build_data( places, stack_workers=None ):
+    # What /data returns, for the plot < places > encodes.
+    _, series_name, geo_specs = decode_places( places )
+    series = web_grab.Series.GetSeries( series_name )
+    stacks = stacker.map_geos( build_geostack, [ ( series_name, geo_spec ) for geo_spec in geo_specs ],
+                               stack_workers )
+    answer = stacker.Stacklist( stacks ).as_data()
+    answer.update({ 'series_name': series_name,
+                    'dataset_when': series.timedname( alpha=True ),
+                    'back_days': stacker.BACK_DAYS })
+    return answer
+
+def build_geostack( job ):
+    series_name, geo_spec = job
+    series = web_grab.Series.GetSeries( series_name )
+    sergeo = web_graphline.SerGeo( filter( None, geo_spec )[-1],   # geo name
+                                   series.get_df( geo_spec ),      # pandas dataframe
+                                   series_name,
+                                   LEFT_TIME )
+    return stacker.make_geostack( stacker.BACK_DAYS, sergeo.diff() )
+
+############################################################################################
+############################################################################################
+# Render pool
+############################################################################################
+############################################################################################
+
+def render_once( pathname, places ):
+    # Builds the image at < pathname > unless it exists, once however many requests ask
+    # for it at the same time.  Callers queue on a lock file beside the image, so this
+    # holds across threads and processes; the first renders, the rest find the image.
+    # Returns True if this call rendered the image, False if it was there already or the
+    # render failed.
+    lock_path = pathname + '.lock'
+    while True:
+        lock_file = open( lock_path, 'a' )
+        fcntl.flock( lock_file, fcntl.LOCK_EX )
+        # The holder before us may have removed the file we waited on; if so, queue anew.
+        try:
+            if os.fstat( lock_file.fileno() ).st_ino == os.stat( lock_path ).st_ino:
+                break
+        except OSError:
+            pass
+        fcntl.flock( lock_file, fcntl.LOCK_UN )
+        lock_file.close()
+    try:
+        if os.path.isfile( pathname ):
+            return False
+        if RENDERER.started():
+            return RENDERER.render( places )
+        else:
+            script = os.path.abspath( __file__ )
+            #pathname = os.path.abspath( pathname )
+            call = [ 'python', script, '-b', places, '--stack-workers', str( stacker.STACK_WORKERS ) ]
+            return subprocess.call( call ) == 0
+    finally:
+        os.remove( lock_path )                  # While still locked; see above
+        # Unlocked explicitly, here and above: render workers forked while the file was
+        # open hold copies of it, so closing it would not release the lock.
+        fcntl.flock( lock_file, fcntl.LOCK_UN )
+        lock_file.close()
+
+def render_places( places ):
+    # What a render worker runs: the -b command, without starting a new Python.
+    build_image( *decode_places( places ), open_plot=False )
+
+def render_worker( address, authkey, jobs ):
+    # A render worker's life: connect back to the server, then run up to < jobs > jobs.
+    # A job is a module-level function and its one argument; the answer is ( error, result ).
+    # Not daemonic, unlike the spawner it came from, so that < stacker.map_geos > may give
+    # a plot its own pool of --stack-workers processes; it leads its own process group, so
+    # that < RenderWorker.kill > takes that pool down with it.
+    signal.signal( signal.SIGCHLD, signal.SIG_DFL )     # Ignored by the spawner it came from
+    multiprocessing.current_process().daemon = False
+    os.setpgid( 0, 0 )
+    connection = multiprocessing.connection.Client( address, authkey=authkey )
+    connection.send( os.getpid() )
+    for _ in range( jobs ):
+        try:
+            function, argument = connection.recv()
+        except EOFError:
+            return                                      # The server is gone
+        try:
+            connection.send( ( None, function( argument ) ) )
+        except Exception as e:
+            connection.send( ( repr( e ), None ) )
+
+def render_spawner( requests, address, authkey, jobs ):
+    # Forks a < render_worker > per request.  Forked itself before the server started any
+    # thread, so no worker inherits a lock some other thread was holding.
+    signal.signal( signal.SIGCHLD, signal.SIG_IGN )     # Workers are reaped without waiting
+    while True:
+        try:
+            requests.recv()
+        except EOFError:
+            return
+        if os.fork() == 0:
+            try:
+                render_worker( address, authkey, jobs )
+            finally:
+                os._exit( 0 )
+
+class RenderWorker:
+    def __init__( self, pid, connection, jobs ):
+        self.pid = pid
+        self.connection = connection
+        self.jobs = jobs                # Left before it exits
+
+    def kill( self ):
+        try:
+            os.killpg( self.pid, signal.SIGKILL )       # With any stack pool it started
+        except OSError:
+            pass                        # Exited already
+        self.connection.close()
+
+class RenderPool:
+    # Long-lived processes that build images for < plot >, and the JSON for < data >.  Matplotlib, pandas and the 
+    # sources are loaded already, and each is replaced after < jobs_per_worker > jobs.  
+    # As with the old -b subprocess, a job that raises or crashes cannot take the server 
+    # down.  < start > must be called before the server starts any thread: it forks a 
+    # spawner process, and every worker, first or replacement, is forked from that, never
+    # from a server thread.  A job that outlives < timeout > has its own worker killed and
+    # replaced; other jobs go on.  Each worker builds a plot's geos in a pool of up to
+    # --stack-workers processes of its own, so a server uses at most < workers > times that.
+    # < workers > = 0, or no < start >, means a new -b subprocess per image instead.
+    workers = 2
+    jobs_per_worker = 50
+    timeout = 180                       # Seconds
+
+    def __init__( self ):
+        self._idle = None               # Queue of RenderWorker, or None for one to replace
+        self._lock = threading.Lock()   # Pairs a spawn request with its connection
+
+    def started( self ):
+        return self._idle is not None
+
+    def start( self ):
+        authkey = multiprocessing.current_process().authkey
+        self._listener = multiprocessing.connection.Listener( family='AF_UNIX', authkey=authkey )
+        self._requests, requests = multiprocessing.Pipe()
+        spawner = multiprocessing.Process( target=render_spawner, args=( requests, 
+                                           self._listener.address, authkey, self.jobs_per_worker ) )
+        spawner.daemon = True
+        spawner.start()
+        requests.close()
+        self._idle = Queue.Queue()
+        for _ in range( self.workers ):
+            self._idle.put( self._spawn() )
+
+    def _spawn( self ):
+        with self._lock:
+            self._requests.send( None )
+            connection = self._listener.accept()
+        return RenderWorker( connection.recv(), connection, self.jobs_per_worker )
+
+    def render( self, places ):
+        # Returns True if the image was built.
+        return self.call( render_places, places )[0]
+
+    def call( self, function, argument ):
+        # Runs < function >( < argument > ) in a worker; < function > must be module-level,
+        # < argument > and the result picklable.  Returns ( True, the result ), or 
+        # ( False, None ) if it raised, crashed or timed out.
+        worker = self._idle.get()
+        try:
+            if worker is None:
+                worker = self._spawn()
+            worker.connection.send( ( function, argument ) )
+            if not worker.connection.poll( self.timeout ):
+                print 'Render timed out, replacing its worker:', argument
+                worker.kill()
+                worker = None
+                return False, None
+            error, result = worker.connection.recv()
+            worker.jobs -= 1
+            if error is not None:
+                print 'Render failed:', argument, error
+                return False, None
+            return True, result
+        except ( EOFError, IOError, OSError ) as e:
+            print 'Render worker lost:', argument, repr( e )
+            if worker is not None:
+                worker.kill()
+                worker = None
+            return False, None
+        finally:
+            if worker is not None and worker.jobs <= 0:
+                worker.connection.close()       # It exits by itself
+                worker = None
+            self._idle.put( worker )
+
+RENDERER = RenderPool()
+
+class RenderJob:
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+    def __init__( self, job_id, pathname ):
+        self.job_id = job_id
+        self.pathname = pathname
+        self.state = RenderJob.QUEUED
+        self.finished = threading.Event()
+
+class RenderJobs:
+    # Plots drawn in the background, so that a request for an uncached plot returns at
+    # once.  At most < threads > jobs run at a time, each waiting on < render_once >; the
+    # rest are queued.  A job id names its image, series version and md5, so a repeat 
+    # request joins the job under way, and a finished image is found on disk even by a
+    # server that never saw the job.  The last < max_jobs > jobs are remembered, and any
+    # more that are still queued or running.
+    threads = 4
+    max_jobs = 1000
+    id_sep = '-'
+    id_pattern = re.compile( r'^[0-9.]+-[0-9a-f]{32}$' )
+
+    def __init__( self ):
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @classmethod
+    def Paths( _, job_id ):
+        # The image's pathname and href; None if < job_id > is not well-formed.
+        if not RenderJobs.id_pattern.match( job_id ):
+            return None
+        series_version, digest = job_id.split( RenderJobs.id_sep )
+        return PLOT_CACHE.paths( series_version, digest )
+
+    def submit( self, job_id, pathname, places ):
+        # Returns < job_id >.  A job that failed is run again.
+        with self._lock:
+            job = self._jobs.get( job_id )
+            if job is not None and job.state != RenderJob.FAILED:
+                return job_id
+            job = self._jobs[ job_id ] = RenderJob( job_id, pathname )
+            if len( self._jobs ) > self.max_jobs:
+                self._prune()
+            if self._pool is None:
+                self._pool = multiprocessing.pool.ThreadPool( self.threads )
+            pool = self._pool
+        pool.apply_async( self._run, ( job, places ) )
+        return job_id
+
+    def _prune( self ):
+        # Forgets the oldest finished jobs, under < _lock >.  Queued and running jobs are
+        # kept, however many, so that their callers can still follow them.
+        excess = len( self._jobs ) - self.max_jobs
+        for job_id, job in self._jobs.items():
+            if excess <= 0:
+                break
+            if job.state in ( RenderJob.DONE, RenderJob.FAILED ):
+                del self._jobs[ job_id ]
+                excess -= 1
+
+    def _run( self, job, places ):
+        job.state = RenderJob.RUNNING
+        try:
+            render_once( job.pathname, places )
+        except Exception as e:
+            print 'Render job failed:', job.job_id, repr( e )
+        job.state = RenderJob.DONE if os.path.isfile( job.pathname ) else RenderJob.FAILED
+        job.finished.set()
+
+    def state( self, job_id, wait=0 ):
+        # None if the job is unknown and its image is not on disk.
+        with self._lock:
+            job = self._jobs.get( job_id )
+        if job is not None:
+            if wait > 0:
+                job.finished.wait( wait )
+            return job.state
+        paths = RenderJobs.Paths( job_id )
+        if paths is not None and os.path.isfile( paths[0] ):
+            return RenderJob.DONE
+        return None
+
+JOBS = RenderJobs()
+PLOT_CACHE = web_plotcache.PlotCache( STATIC_DIRPATH, STATIC_HREF0 )
+
+class Prewarmer:
+    # Draws the most popular plots (see < web_popular >) for a new snapshot before anyone
+    # asks for them, so that the first visitor of a bookmarked plot after an ingest does 
+    # not wait for it.  Runs as its own process, started after a poll that swapped in new
+    # data, at lower CPU priority and with one render worker, so that plots users are
+    # waiting for come first.  It draws at most < plots > plots, of those asked for in the 
+    # last < days >, and starts no new plot after < seconds >.  Plots whose image exists
+    # already, e.g. because a user asked first, are skipped.
+    plots = 50
+    seconds = 600
+    days = 14
+    niceness = 10
+    workers = 1
+
+    def start( self ):
+        web_popular.POPULAR.flush()         # So that the prewarm process sees this one's counts
+        script = os.path.abspath( __file__ )
+        call = [ 'python', script, '--prewarm', '--prewarm-plots', str( self.plots ), 
+                 '--prewarm-seconds', str( self.seconds ), '--render-workers', str( self.workers ) ]
+        print 'Starting prewarm of up to %d plots' % self.plots
+        # In the script's directory, not cron's, like the server that serves the images.
+        subprocess.Popen( call, preexec_fn=self._lower_priority, close_fds=True, 
+                          cwd=os.path.dirname( script ) )
+
+    def _lower_priority( self ):
+        os.nice( self.niceness )
+
+    def run( self ):
+        # Returns the number of plots drawn.
+        t0 = time.time()
+        drawn = 0
+        for key, hits in web_popular.POPULAR.top( self.plots, self.days ):
+            if time.time() - t0 >= self.seconds:
+                print 'Prewarm out of time'
+                break
+            _, series_name, geo_specs = decode_places( key )
+            if series_name not in web_grab.Series.Name2Instance:
+                continue
+            pathname = plot_paths( series_name, geo_specs )[2]
+            try:
+                if render_once( pathname, encode_places( pathname, series_name, geo_specs ) ):
+                    drawn += 1
+            except Exception as e:
+                print 'Prewarm failed:', key, repr( e )
+        print 'Prewarmed %d plots in %.2f sec' % ( drawn, time.time()-t0 )
+        return drawn
+
+PREWARMER = Prewarmer()
+
 ############################################################################################
 
 # Example: 'xyz.png@cases_NYT@USA~New Hampshire~@USA~New Hampshire~Grafton@USA~Texas~Bexar@USA~Louisiana~'
@@ -241,10 +658,34 @@ DEFAULT_P = '@cases_NYT@USA~New Hampshire~@USA~New Hampshire~Grafton@USA~Texas~H
 
 def main( args ):
    
+    if args.stack_workers is not None:
+        stacker.STACK_WORKERS = args.stack_workers
+    if args.render_workers is not None:
+        RENDERER.workers = args.render_workers
+    if args.prewarm_plots is not None:
+        PREWARMER.plots = args.prewarm_plots
+    if args.prewarm_seconds is not None:
+        PREWARMER.seconds = args.prewarm_seconds
+
     if args.g:
         # Must precede -r so we can say -gr
         print 'Will grab data from web'
-        web_grab.check_for_new_web_sources()
+        generation = web_grab.Snapshots.generation()
+        web_grab.check_for_new_web_sources( store_format=args.store, workers=args.poll_workers,
+                                            processes=args.poll_processes, incremental=args.incremental )
+        web_leaders.build_leaderboard( LEFT_TIME )
+        if web_grab.Snapshots.generation() != generation:
+            PREWARMER.start()
+        PLOT_CACHE.collect()
+
+    if args.prewarm:
+        if not os.path.isdir( STATIC_DIRPATH ):
+            # Images drawn anywhere else would never be served.
+            print 'Will not prewarm: no image directory', STATIC_DIRPATH
+        else:
+            if RENDERER.workers > 0:
+                RENDERER.start()
+            PREWARMER.run()
 
     if args.test:
         build_image( *decode_places( DEFAULT_P ), open_plot=True )
@@ -271,6 +712,8 @@ def main( args ):
     
     if args.r:
         print 'Will run on port', DEFAULT_SERVER_PORT
+        if RENDERER.workers > 0 and not RENDERER.started():
+            RENDERER.start()                # Before the server's threads; see < RenderPool >
         if IS_MAC:
             app.run( port=DEFAULT_SERVER_PORT)
         else:
@@ -284,6 +727,15 @@ if __name__ == '__main__':
     parser.add_argument("-r", action="store_true", help="run as web server")
     parser.add_argument("-g", action="store_true", help="grab data from web")
     parser.add_argument("-b", help="build plot")
+    parser.add_argument("--poll-workers", type=int, help="with -g, sources polled concurrently (default: %d)" % web_grab.WebSource.poll_workers)
+    parser.add_argument("--poll-processes", action="store_true", default=None, help="with -g, poll in processes rather than threads")
+    parser.add_argument("--incremental", action="store_true", default=None, help="with -g, append new dates to csv snapshot unless history was revised")
+    parser.add_argument("--stack-workers", type=int, help="processes that load and fit a plot's geos, per -b or render worker (default: %d)" % stacker.STACK_WORKERS)
+    parser.add_argument("--render-workers", type=int, help="with -r or --prewarm, processes that build plot images; 0 = a new process per image (default: %d)" % RenderPool.workers)
+    parser.add_argument("--prewarm", action="store_true", help="draw the most popular plots not yet drawn for the current data")
+    parser.add_argument("--prewarm-plots", type=int, help="with -g or --prewarm, most plots to prewarm (default: %d)" % Prewarmer.plots)
+    parser.add_argument("--prewarm-seconds", type=int, help="with -g or --prewarm, start no new plot after this (default: %d)" % Prewarmer.seconds)
+    parser.add_argument("--store", choices=web_grab.STORE_FORMATS, help="with -g, storage format for sprayed data (default: as stored, else csv)")
     parser.add_argument("-q", action="store_true", help="experiment du jour [DEV]")
     parser.add_argument("--pchan", help="plot this data-channel-name", default="cases_JHU")
     parser.add_argument("--pgeo",  help="plot this geography-string. Fmt=%s" % PLACE_SEP1.join(['X','Y','Z']) )
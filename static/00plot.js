@@ -0,0 +1,200 @@
+// Draws the stacked trend plot in the browser, from the JSON of /data, for the
+// view=client page (templates/plot_client.html).  Same layout as web_stacker.stacker0:
+// on the left, each geo's layers of % daily change over the halving (green) and
+// doubling (red) zones; on the right, each geo's daily values and their extrapolations.
+
+var ROW = 20;                   // Pixels per plotline, as web_stacker.PIXELS_PER_PLOTLINE
+var TOP = 70, BOTTOM = 50, MARGIN = 10, GAP = 60;
+
+function loadTrends( href, canvas, status ) {
+    var request = new XMLHttpRequest();
+    request.open( 'GET', href );
+    request.onload = function() {
+        if ( request.status != 200 ) {
+            status.innerHTML = 'Could not get the data for this plot.';
+            return;
+        }
+        status.style.display = 'none';
+        drawTrends( canvas, JSON.parse( request.responseText ) );
+    };
+    request.onerror = function() { status.innerHTML = 'Could not get the data for this plot.'; };
+    request.send();
+}
+
+function drawTrends( canvas, data ) {
+    var rows = 0;
+    data.stacks.forEach( function( stack ) { rows += stack.layers.length + 2; } );
+    rows -= 1;                                      // No blank line beneath the last geo
+    canvas.width = canvas.parentNode.clientWidth || 1200;
+    canvas.height = TOP + rows * ROW + BOTTOM;
+    var ctx = canvas.getContext( '2d' );
+    var half = ( canvas.width - 2 * MARGIN - GAP ) / 2;
+    var y0 = TOP, y9 = TOP + rows * ROW;
+    var pct0 = data.pct_range[0], pct9 = data.pct_range[1];
+    function xPct( pct ) { return MARGIN + ( pct - pct0 ) / ( pct9 - pct0 ) * half; }
+
+    // Title bar, zones, and doubling-time ticks.
+    ctx.font = '14px sans-serif';
+    ctx.textAlign = 'center';
+    ctx.fillStyle = 'yellow';
+    ctx.fillRect( 0, 0, canvas.width, 24 );
+    ctx.fillStyle = 'black';
+    ctx.fillText( 'daily ' + data.series_name + ' -- ' + data.back_days + '-day Trend Fits -- Dataset of: ' +
+                  data.dataset_when, canvas.width / 2, 17 );
+    ctx.fillStyle = '#bbffbb';
+    ctx.fillRect( xPct( pct0 ), y0, xPct( 0 ) - xPct( pct0 ), y9 - y0 );
+    ctx.fillStyle = '#FF7F7F';
+    ctx.fillRect( xPct( 0 ), y0, xPct( pct9 ) - xPct( 0 ), y9 - y0 );
+    ctx.font = '11px sans-serif';
+    ctx.fillStyle = 'black';
+    data.ticks.forEach( function( tick ) {
+        var x = xPct( tick[0] );
+        ctx.setLineDash( [ 1, 3 ] );
+        line( ctx, [ x, x ], [ y0, y9 ], 'black', 0.5 );
+        ctx.setLineDash( [] );
+        ctx.textAlign = 'center';
+        ctx.fillText( Math.abs( tick[1] ) + 'd', x, y0 - 6 );
+    });
+    ctx.textAlign = 'left';
+    ctx.fillText( 'Halving time (days)', xPct( pct0 ), y0 - 24 );
+    ctx.textAlign = 'right';
+    ctx.fillText( 'Doubling time (days)', xPct( pct9 ), y0 - 24 );
+    ctx.textAlign = 'center';
+    ctx.fillText( '% Daily Change', MARGIN + half / 2, y9 + 30 );
+
+    var denom = 0;
+    data.stacks.forEach( function( stack ) { denom += stack.mean_of_raw || 0; } );
+    denom = denom / data.stacks.length || 1;
+    var y = y0 + ROW / 2;
+    data.stacks.forEach( function( stack, i ) {
+        var top = y - ROW / 2;
+        y = drawLayers( ctx, stack, y, xPct, denom );
+        var isLast = ( i == data.stacks.length - 1 );
+        drawWaveform( ctx, stack, MARGIN + half + GAP, top, half, ( isLast ? y - ROW : y ) - ROW / 2 - top, isLast );
+    });
+}
+
+function drawLayers( ctx, stack, y, xPct, denom ) {
+    // Returns the y of the next geo's label.  Mirrors Geostack.plot_layers and Layer.plot.
+    var n = stack.layers.length;
+    var linewidth = Math.min( Math.max( 0.5, 17.5 * ( stack.mean_of_raw || 0 ) / denom ), 15.5 );
+    var pcts0 = present( stack.layers[0] );
+    var mid = pcts0.length ? ( Math.min.apply( null, pcts0 ) + Math.max.apply( null, pcts0 ) ) / 2 : 0;
+    ctx.fillStyle = 'black';
+    ctx.textAlign = 'center';
+    ctx.fillText( stack.label, xPct( mid ), y + 4 );
+    var connects_x = [], connects_y = [];
+    stack.layers.forEach( function( pcts, i ) {
+        y += ROW;
+        var kolor = 'rgba(0,0,0,' + ( 1 - i / n ) + ')';
+        var shown = present( pcts );
+        if ( !shown.length ) {
+            ctx.fillStyle = kolor;
+            ctx.textAlign = 'left';
+            ctx.fillText( '< omitted >', xPct( 0 ), y + 4 );
+            return;
+        }
+        var lo = Math.min.apply( null, shown ), hi = Math.max.apply( null, shown );
+        if ( lo != hi ) {
+            line( ctx, [ xPct( lo ), xPct( hi ) ], [ y, y ], kolor, linewidth );
+        }
+        ctx.fillStyle = kolor;
+        pcts.forEach( function( pct, j ) {
+            if ( pct === null ) return;
+            var x = xPct( pct );
+            ctx.beginPath();
+            if ( j == 0 ) ctx.rect( x - 3, y - 3, 6, 6 );           // Raw: square
+            else ctx.arc( x, y, 3.5, 0, 2 * Math.PI );              // Smoothed: circle
+            ctx.fill();
+            if ( pct == hi || pct == lo ) {
+                ctx.textAlign = ( pct == hi ) ? 'left' : 'right';
+                ctx.fillText( '  ' + pct.toFixed( 1 ) + '%  ', x + ( pct == hi ? 4 : -4 ), y + 4 );
+            }
+        });
+        if ( pcts.length > 1 && pcts[1] !== null ) {
+            connects_x.push( xPct( pcts[1] ) );
+            connects_y.push( y );
+        }
+    });
+    line( ctx, connects_x, connects_y, 'blue', 1 );
+    return y + 2 * ROW;
+}
+
+function drawWaveform( ctx, stack, left, top, width, height, isLast ) {
+    // Mirrors Geostack.waveform: raw values thin, smoothed thick, each with its extrapolation.
+    var curves = [], linewidths = [ 1, 3 ];
+    stack.series.forEach( function( s, i ) { curves.push( [ s, linewidths[i] ] ); } );
+    stack.extrapolated.forEach( function( s, i ) { if ( s ) curves.push( [ s, linewidths[i] ] ); } );
+    var dayMin = Infinity, dayMax = -Infinity, highest = 0, yMax = 0;
+    curves.forEach( function( curve, k ) {
+        var start = dayNumber( curve[0].start );
+        curve[0].days.forEach( function( d, j ) {
+            dayMin = Math.min( dayMin, start + d );
+            dayMax = Math.max( dayMax, start + d );
+            var v = curve[0].values[j];
+            if ( v !== null ) {
+                yMax = Math.max( yMax, v );
+                if ( k == 0 ) highest = Math.max( highest, v );
+            }
+        });
+    });
+    yMax = Math.min( 2.5 * highest, yMax ) || 1;
+    function xDay( day ) { return left + ( day - dayMin ) / Math.max( dayMax - dayMin, 1 ) * width; }
+    function yValue( v ) { return top + height - Math.max( 0, Math.min( v / yMax, 1 ) ) * height; }
+    ctx.strokeStyle = 'black';
+    ctx.lineWidth = 0.5;
+    ctx.strokeRect( left, top, width, height );
+    ctx.save();
+    ctx.beginPath();
+    ctx.rect( left, top, width, height );
+    ctx.clip();
+    var colors = [ '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728' ];     // Matplotlib's first four
+    curves.forEach( function( curve, k ) {
+        var start = dayNumber( curve[0].start ), xs = [], ys = [];
+        curve[0].days.forEach( function( d, j ) {
+            var v = curve[0].values[j];
+            if ( v === null ) {
+                line( ctx, xs, ys, colors[ k % colors.length ], curve[1] );
+                xs = []; ys = [];
+            } else {
+                xs.push( xDay( start + d ) );
+                ys.push( yValue( v ) );
+            }
+        });
+        line( ctx, xs, ys, colors[ k % colors.length ], curve[1] );
+    });
+    ctx.restore();
+    ctx.fillStyle = 'black';
+    ctx.textAlign = 'left';
+    ctx.fillText( stack.label, left + 6, top + 14 );
+    ctx.textAlign = 'right';
+    ctx.fillText( Math.round( yMax ), left + width - 4, top + 14 );
+    if ( isLast ) {
+        ctx.textAlign = 'left';
+        ctx.fillText( dayLabel( dayMin ), left, top + height + 14 );
+        ctx.textAlign = 'right';
+        ctx.fillText( dayLabel( dayMax ), left + width, top + height + 14 );
+    }
+}
+
+function present( pcts ) {
+    return pcts.filter( function( pct ) { return pct !== null; } );
+}
+
+function line( ctx, xs, ys, color, width ) {
+    if ( xs.length < 2 ) return;
+    ctx.beginPath();
+    ctx.moveTo( xs[0], ys[0] );
+    for ( var i = 1; i < xs.length; i++ ) ctx.lineTo( xs[i], ys[i] );
+    ctx.strokeStyle = color;
+    ctx.lineWidth = width;
+    ctx.stroke();
+}
+
+function dayNumber( iso ) { return Date.parse( iso + 'T00:00:00Z' ) / 86400000; }
+
+function dayLabel( day ) {
+    var months = [ 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec' ];
+    var date = new Date( day * 86400000 );
+    return ( '0' + date.getUTCDate() ).slice( -2 ) + months[ date.getUTCMonth() ];
+}
@@ -0,0 +1,51 @@
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import web_grab
+
+class FreshTreeTest( unittest.TestCase ):
+    # A fresh install: no source has been polled into vDATA1 yet.
+
+    def setUp( self ):
+        self.dirpath1 = web_grab.DiskFile0.dirpath1
+        self.root = tempfile.mkdtemp()
+        web_grab.DiskFile0.dirpath1 = self.root
+        web_grab.Snapshots._current = None          # Loaded from < root > on next use
+        self.series = [ series for series in web_grab.Series.AlphaList() if len( series.source_instances ) > 1 ][0]
+
+    def tearDown( self ):
+        web_grab.DiskFile0.dirpath1 = self.dirpath1
+        web_grab.Snapshots._current = None
+        shutil.rmtree( self.root )
+
+    def poll( self, source, mtime ):
+        # Just the files a < Snapshot > reads.
+        dirpath = os.path.join( self.root, source.dirname )
+        os.makedirs( dirpath )
+        for filename, text in ( ( source.digest_filename, 'abc' ), ( source.geotree_filename, '{}' ),
+                                ( source.contents_filename, '' ) ):
+            with open( os.path.join( dirpath, filename ), 'w' ) as f:
+                f.write( text )
+        os.utime( source.path_to_content_file(), ( mtime, mtime ) )
+        web_grab.Snapshots.bump()
+
+    def test_nothing_polled( self ):
+        snapshot = web_grab.Snapshot( None, web_grab.Source.Instances )
+        self.assertEqual( snapshot.mtime( self.series ), None )
+        self.assertEqual( self.series.timedname( alpha=True ), None )
+
+    def test_home_page( self ):
+        import flask_main
+        response = flask_main.app.test_client().get( flask_main.HOME_HREF )
+        self.assertEqual( response.status_code, 200 )
+        self.assertIn( 'Not polled yet', response.data )
+
+    def test_some_sources_polled( self ):
+        self.poll( self.series.source_instances[0], 1600000000 )
+        snapshot = web_grab.Snapshot( None, web_grab.Source.Instances )
+        self.assertEqual( snapshot.mtime( self.series ), 1600000000 )
+        self.assertNotEqual( self.series.timedname( compact=True ), None )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os, sys, unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import web_grab
+import web_graphline
+import web_leaders
+import web_stacker
+
+LEFT_TIME = 45
+SERIES_NAME = 'cases_TEST'
+
+class FakeSeries:
+    # Just what < web_leaders.series_rows > asks of a Series.
+    name_internal = SERIES_NAME
+
+    def __init__( self, matrix ):
+        self._matrix = matrix
+
+    def matrix( self ):
+        return self._matrix
+
+class SeriesRowsTest( unittest.TestCase ):
+
+    def test_gappy_geo_matches_plot( self ):
+        # One geo reported daily, one only on some days: the matrix has NaN on the others.
+        dates = pd.date_range( '2020-04-01', periods=70 )
+        daily = 100. * np.exp( 0.05 * np.arange( 70 ) ).cumsum()
+        reported = np.ones( 70, dtype=bool )
+        reported[ 5::3 ] = False
+        reported[ 60:63 ] = False
+        gappy = np.where( reported, 50. * np.exp( 0.03 * np.arange( 70 ) ).cumsum(), np.nan )
+        geos = [ ( 'USA', 'Texas', '' ), ( 'USA', 'Texas', 'Bexar' ) ]
+        matrix = web_grab.GeoMatrix( geos, dates, np.array([ daily, gappy ]) )
+        rows = web_leaders.series_rows( FakeSeries( matrix ), LEFT_TIME, web_stacker.BACK_DAYS, 7 )
+        self.assertEqual( len( rows ), 2 )
+        for row, values in zip( rows, ( daily, gappy ) ):
+            field = dict( zip( web_leaders.FIELDS, row ) )
+            # As < flask_main.build_geostack > builds it, from the rows the source holds.
+            df = pd.DataFrame({ SERIES_NAME: values[ ~np.isnan( values ) ] }, 
+                              index=dates[ ~np.isnan( values ) ] )
+            sergeo = web_graphline.SerGeo( row[4] or row[3], df, SERIES_NAME, LEFT_TIME ).diff()
+            top = web_stacker.make_geostack( web_stacker.BACK_DAYS, sergeo )._layers[0]._points
+            self.assertAlmostEqual( field[ 'pct_raw' ], top[0].pct, places=6 )
+            self.assertAlmostEqual( field[ 'pct_smooth' ], top[1].pct, places=6 )
+
+if __name__ == '__main__':
+    unittest.main()
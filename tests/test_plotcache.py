@@ -0,0 +1,50 @@
+import os, sys, shutil, tempfile, time, unittest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import flask_main
+import web_plotcache
+
+class CollectTest( unittest.TestCase ):
+    # Cron runs -g, which ends in < PLOT_CACHE.collect >, from an arbitrary directory.
+
+    def setUp( self ):
+        self.cwd = os.getcwd()
+        self.root = tempfile.mkdtemp()
+        self.elsewhere = tempfile.mkdtemp()
+        os.chdir( self.elsewhere )
+
+    def tearDown( self ):
+        os.chdir( self.cwd )
+        shutil.rmtree( self.root )
+        shutil.rmtree( self.elsewhere )
+
+    def test_static_dirpath_is_absolute( self ):
+        self.assertTrue( os.path.isabs( flask_main.STATIC_DIRPATH ) )
+        self.assertEqual( flask_main.PLOT_CACHE.dirpath, flask_main.STATIC_DIRPATH )
+
+    def test_collect_from_another_cwd( self ):
+        cache = web_plotcache.PlotCache( os.path.join( self.root, 'static' ), '/static' )
+        os.makedirs( cache.dirpath )
+        kept, _ = cache.paths( '261018.201221', 'ab' * 16 )
+        gone, _ = cache.paths( '250101.000000', 'cd' * 16 )
+        for pathname in ( kept, gone ):
+            os.makedirs( os.path.dirname( pathname ) )
+            with open( pathname, 'w' ) as f:
+                f.write( 'png' )
+        old = time.time() - 2 * cache.grace
+        os.utime( gone, ( old, old ) )
+        os.utime( os.path.dirname( gone ), ( old, old ) )
+        os.utime( os.path.dirname( os.path.dirname( gone ) ), ( old, old ) )
+        report = cache.collect( versions=set([ '261018.201221' ]) )
+        self.assertEqual( report['files'], 1 )
+        self.assertEqual( report['removed_versions'], 1 )
+        self.assertTrue( os.path.isfile( kept ) )
+        self.assertFalse( os.path.exists( gone ) )
+
+    def test_collect_without_static_dir( self ):
+        cache = web_plotcache.PlotCache( os.path.join( self.root, 'missing' ), '/static' )
+        self.assertEqual( cache.collect( versions=set() )['files'], 0 )
+
+if __name__ == '__main__':
+    unittest.main()
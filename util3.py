@@ -146,7 +146,14 @@ class Plot:
             self._save()
 
     def _save( self ):
-        plt.savefig( self.pathname )
+        # Written under a temporary name and renamed into place, so that the web server
+        # never serves a half-written image.  Closed after, for long-lived render workers.
+        # Saved by the figure, not < plt.savefig >, which draws the whole figure a second
+        # time afterwards (< draw_idle >) for the sake of interactive windows.
+        temp_path = '%s.%d.tmp' % ( self.pathname, os.getpid() )
+        self.fig.savefig( temp_path, format=os.path.splitext( self.pathname )[1][1:] or 'png' )
+        os.rename( temp_path, self.pathname )               # Atomic on Unix
+        plt.close( self.fig )
 
     #     def make_axlist( self ):
     #         self.axlist = [ plt.subplot( self.nrows, self.ncols, i+1 ) for i in range( self.nrows*self.ncols ) ]
@@ -1,6 +1,7 @@
 # !/usr/bin/python
 
-import StringIO, md5, os, time, datetime, glob, collections, shutil, json, math
+import md5, os, time, datetime, glob, collections, shutil, json, math, threading, copy
+import multiprocessing.pool
 
 import pandas as pd
 import numpy as np
@@ -28,8 +29,65 @@ def is_nan( x ):
 ############################################################################################
 ############################################################################################
 
+class FrameCache:
+    # Bounded LRU cache of the dataframes returned by < Series.get_df >, capped by entry 
+    # count and by approximate bytes.  Each entry carries the digests of the snapshots it 
+    # was read from; once a poll swaps in a new snapshot the digests no longer match, and 
+    # the stale entry is dropped on its next lookup.  Thread-safe.
+    def __init__( self, max_entries=512, max_bytes=64<<20 ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()   # key -> ( digests, df, nbytes ), oldest first
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = self.stale = 0
+
+    def get( self, key, digests ):
+        # Returns a copy, so that callers cannot alter the cached frame.
+        with self._lock:
+            entry = self._entries.pop( key, None )
+            if entry is not None:
+                if entry[0] == digests:
+                    self._entries[ key ] = entry
+                    self.hits += 1
+                    return entry[1].copy()
+                self.nbytes -= entry[2]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put( self, key, digests, df ):
+        nbytes = int( df.memory_usage( index=True, deep=True ).sum() )
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop( key, None )
+            if old is not None:
+                self.nbytes -= old[2]
+            self._entries[ key ] = ( digests, df, nbytes )
+            self.nbytes += nbytes
+            while len( self._entries ) > self.max_entries or self.nbytes > self.max_bytes:
+                _, ( _, _, n ) = self._entries.popitem( last=False )
+                self.nbytes -= n
+                self.evictions += 1
+
+    def clear( self ):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats( self ):
+        with self._lock:
+            return { 'entries': len( self._entries ), 'bytes': self.nbytes, 'hits': self.hits, 
+                     'misses': self.misses, 'evictions': self.evictions, 'stale': self.stale }
+
+    def __str__( self ):
+        return '%(entries)d frames, %(bytes)d bytes; %(hits)d hits, %(misses)d misses, ' \
+               '%(evictions)d evictions, %(stale)d stale' % self.stats()
+
 class Series:
     Name2Instance = {}
+    Frames = FrameCache()               # Shared by all series; see < get_df >
     def __init__( self, name_internal, hide_box, hide_name ):
         self.hide_box = hide_box
         self.hide_name = hide_name
@@ -38,14 +96,16 @@ class Series:
         self.name_external = '%s [%s]' % ( parts[0], parts[1].upper() )
         self.name_external_simplest = parts[0].title()
         self.source_instances = []      # set in < Add > classmethod
-        self._geo_tree = None           # set in < geo_tree > method
     
     def timedname( self, alpha=False, formal=False, spaced=False, compact=False ):
         # Initially cached the value of < localtime > in a slot, but this prevented the
         # value from updating when a separate process (e.g. cron) did -g update option.
+        # Now answered from the current snapshot, which follows such updates.
+        # None if no source of the series has been polled yet, e.g. on a fresh install.
         # From: https://stackoverflow.com/questions/12458595/convert-timestamp-since-epoch-to-datetime-datetime
-        mtime = max([ os.path.getmtime( source.path_to_content_file() ) 
-                      for source in self.source_instances ])
+        mtime = Snapshots.current().mtime( self )
+        if mtime is None:
+            return None
         localtime = time.localtime(mtime)
         if alpha:   return time.strftime( '%d%b%y %H:%M %Z',      localtime )
         if formal:  return time.strftime( '%Y-%m-%d-%H.%M.%S-%Z', localtime )
@@ -74,15 +134,12 @@ class Series:
         return Series.Name2Instance[ name_internal ]
 
     def geo_tree( self ):
-        if self._geo_tree is None:
-            self._geo_tree = {}
-            #print 838323, self.source_instances
-            if self.source_instances:
-                # Uses Assumption 3774941014: generates fresh copy every time
-                self._geo_tree = self.source_instances[0].get_geotree()
-                for source in self.source_instances[1:]:
-                    self._geo_tree = merge_dicts(self._geo_tree,source.get_geotree())
-        return self._geo_tree
+        return Snapshots.current().geo_tree( self )
+
+    def matrix( self ):
+        # Dense geo-by-day < GeoMatrix > of every geo in the series, for questions that span 
+        # many geos.  None until the sources have been polled.
+        return Snapshots.current().matrix( self )
 
     def geo_tree_as_json_str( self ):
         #print 652794, self, self.source_instances
@@ -90,16 +147,146 @@ class Series:
 
     def get_df( self, geo_triple ):
         # Is called from main Flask page-building file.
-        nation, state, county = geo_triple
-        df_list = [ source.get_df3_from_disk( None if nation==EMPTY else nation, 
-                                              None if state ==EMPTY else state, 
-                                              None if county==EMPTY else county ) 
-                    for source in self.source_instances ]
-        df_list = [ df for df in df_list if df is not None ]
-        if len( df_list ) != 1:
+        # Keyed by the snapshot digests as well, so a poll invalidates without a restart.
+        key = ( self.name_internal, tuple([ part or EMPTY for part in geo_triple ]) )
+        snapshot = Snapshots.current()
+        digests = snapshot.digests( self )
+        df = Series.Frames.get( key, digests ) if None not in digests else None
+        if df is None:
+            df = self._get_df_from_disk( key[1], snapshot )
+            if None not in digests:
+                Series.Frames.put( key, digests, df )
+                df = df.copy()
+        return df
+
+    def _get_df_from_disk( self, geo_triple, snapshot ):
+        # Only the one source that serves < geo_triple > is asked.
+        source = snapshot.route( self, geo_triple )
+        df = None
+        if source is not None:
+            nation, state, county = geo_triple
+            df = source.get_df3_from_disk( nation or None, state or None, county or None )
+        if df is None:
             raise WebSourceException( 'Found no data source for %s / %s' 
                                       % ( self.name_internal, geo_triple ) )
-        return df_list[0]        
+        return df
+
+
+############################################################################################
+############################################################################################
+# Snapshots
+############################################################################################
+############################################################################################
+
+class Snapshot:
+    # One version of vDATA1 as seen by readers: for every polled source, its digest, 
+    # geotree and content-file mtime, loaded once.  Never altered after loading, so
+    # readers holding it see one consistent version; a newer version is a new Snapshot.
+    def __init__( self, stamp, sources ):
+        self.stamp = stamp
+        self._digests = {}
+        self._geotrees = {}
+        self._mtimes = {}
+        for source in sources:
+            digest_path = os.path.join( source.dirpath1, source.dirname, source.digest_filename )
+            if not os.path.isfile( digest_path ):
+                continue                # Not polled yet
+            with open( digest_path, 'r' ) as f:
+                self._digests[ source ] = f.read().strip()
+            self._geotrees[ source ] = source.get_geotree()
+            try:
+                self._mtimes[ source ] = os.path.getmtime( source.path_to_content_file() )
+            except OSError:
+                pass                    # Polled by an older version that stored no contents
+        self._series_geotrees = {}      # Filled lazily by < geo_tree >
+        self._series_routes = {}        # Filled lazily by < route >
+        self._series_matrices = {}      # Filled lazily by < matrix >
+
+    def digests( self, series ):
+        return tuple( self._digests.get( source, None ) for source in series.source_instances )
+
+    def mtime( self, series ):
+        # Of the series' newest polled source; None if none has been polled yet.
+        mtimes = [ self._mtimes[ source ] for source in series.source_instances if source in self._mtimes ]
+        return max( mtimes ) if mtimes else None
+
+    def geo_tree( self, series ):
+        tree = self._series_geotrees.get( series, None )
+        if tree is None:
+            tree = {}
+            for source in series.source_instances:
+                if source in self._geotrees:
+                    # merge_dicts alters its first argument, so merge copies.
+                    tree = merge_dicts( tree, copy.deepcopy( self._geotrees[ source ] ) )
+            self._series_geotrees[ series ] = tree
+        return tree
+
+    def matrix( self, series ):
+        if series not in self._series_matrices:
+            self._series_matrices[ series ] = GeoMatrix.Stack([ 
+                GeoMatrix.Load( os.path.join( source.dirpath1, source.dirname, MATRIX ), series.name_internal )
+                for source in series.source_instances if source in self._digests ])
+        return self._series_matrices[ series ]
+
+    def route( self, series, geo_triple ):
+        # Returns the source that serves < geo_triple >, or None.
+        routes = self._series_routes.get( series, None )
+        if routes is None:
+            routes = {}
+            for source in series.source_instances:
+                if source in self._geotrees:
+                    for triple in source.geo_triples( self._geotrees[ source ] ):
+                        routes.setdefault( triple, source )
+            self._series_routes[ series ] = routes
+        return routes.get( geo_triple, None )
+
+class SnapshotRegistry:
+    # Hands out the current Snapshot.  Every poll that swaps a source into vDATA1 rewrites
+    # generation.txt, so one stat per call tells whether to load a new Snapshot, even when
+    # the poll ran in another process (e.g. cron with -g).  The swap is a single assignment.
+    generation_filename = 'generation.txt'
+
+    def __init__( self ):
+        self._current = None
+        self._lock = threading.Lock()
+
+    def generation_path( self ):
+        return os.path.join( DiskFile0.dirpath1, self.generation_filename )
+
+    def generation( self ):
+        # Changes whenever a poll swaps in a source; None before the first swap.
+        try:
+            st = os.stat( self.generation_path() )
+            return ( st.st_ino, st.st_mtime, st.st_size )
+        except OSError:
+            return None
+
+    def current( self ):
+        stamp = self.generation()
+        snapshot = self._current
+        if snapshot is None or snapshot.stamp != stamp:
+            with self._lock:
+                snapshot = self._current
+                if snapshot is None or snapshot.stamp != stamp:
+                    try:
+                        snapshot = self._current = Snapshot( stamp, Source.Instances )
+                    except ( IOError, OSError, ValueError ):
+                        # Caught a source between the renames of its swap; keep the 
+                        # previous version and load again on the next call.
+                        if snapshot is None:
+                            raise
+        return snapshot
+
+    def bump( self ):
+        # Called after each swap into vDATA1.  The temp name is unique to the process and 
+        # thread, so concurrent pollers never share one.
+        path = self.generation_path()
+        temp_path = '%s.%d.%d.tmp' % ( path, os.getpid(), threading.current_thread().ident )
+        with open( temp_path, 'w' ) as f:
+            f.write( repr( time.time() ) )
+        os.rename( temp_path, path )                    # Atomic on Unix
+
+Snapshots = SnapshotRegistry()
 
 def merge_dicts(a, b, path=None):
     # Adapted from: 
@@ -146,8 +333,17 @@ class Source:
     #                 source.geoname2path[ canonize_geoname( geo_name ) ] = path
 
 SPRAY = 'spray'
+COLUMNS = 'columns'
+ROLLUP = 'rollup'
+MATRIX = 'matrix'
 USA = 'USA'
 EMPTY = ''
+KEY_SEP = '~'
+
+# Storage backends for the sprayed data, chosen at ingest time (-g --store).
+STORE_CSV = 'csv'           # One .csv file per spray_field value, parsed on every read
+STORE_NPY = 'npy'           # One memory-mapped, column-oriented store per source
+STORE_FORMATS = ( STORE_CSV, STORE_NPY )
 
 class DiskFile0:
     # vDATA0
@@ -157,6 +353,8 @@ class DiskFile0:
     #    nyt_us_counties
     #        contents.csv
     #        digest.txt
+    #        validators.json (ETag and Last-Modified of contents.csv, for conditional GET)
+    #        layout.txt (store format and layout version of spray, e.g. csv.3)
     #        geotree.json
     #        spray
     #            alabama
@@ -169,8 +367,29 @@ class DiskFile0:
     #        spray
     #            alabama
     #            alaska
+    #        rollup   (state totals, same layout as spray)
+    #            alabama
+    #            alaska
+    #        matrix   (every source, either store format; see < write_geo_matrix >)
+    #            geos.json
+    #            dates.npy
+    #            cases_JHU.npy
+    #        when=20-05-02-1631-PT.txt (contents = time.time() value )
+    #    jhu_nation_cases         (ingested with --store npy)
+    #        contents.csv
+    #        digest.txt
+    #        geotree.json
+    #        columns
+    #            meta.json
+    #            values.npy
+    #            dates.npy
+    #        rollup   (nation totals, same layout as columns)
+    #            meta.json
+    #            values.npy
+    #            dates.npy
     #        when=20-05-02-1631-PT.txt (contents = time.time() value )
     # vDATAx
+    #    jhu_us_counties_< time.time() >.download (streamed from web; removed after poll)
     #    jhu_us_counties_< time.time() >
     #        contents.csv
     #        digest.txt
@@ -185,31 +404,39 @@ class DiskFile0:
     dirpathx = os.path.join( SUPERDIR_PATH, 'vDATAx' )
     contents_filename = 'contents.csv'
     digest_filename   = 'digest.txt'
+    validators_filename = 'validators.json'
+    layout_filename   = 'layout.txt'
+    layout_version    = 4               # Bump when the spray layout changes, to force a rebuild
     geotree_filename  = 'geotree.json'
     whenfile_name_fmt = 'when=%s.txt'
     now_fmt = '%y-%m-%d-%H%M-%z'
+    store_format = None                 # Set by < check_for_new_web_sources >; see < spray_format >
 
-    def pre_spray( self, dirname, new_contents, new_digest ):
+    def pre_spray( self, dirname, download_path, new_digest, new_validators ):
         digest_path = os.path.join( self.dirpath1, dirname, self.digest_filename )
-        if os.path.isfile( digest_path ):
+        if os.path.isfile( digest_path ) and self.stored_layout( dirname ) == self.layout():
             with open( digest_path, 'r' ) as f:
                 old_digest = f.read().strip()
-                if old_digest == new_digest:
-                    return None, None, None, None
+            if old_digest == new_digest:
+                # Same bytes under new validators: remember them so next poll gets a 304.
+                self.write_validators( os.path.join( self.dirpath1, dirname ), new_validators )
+                return None, None, None, None
         timetime = str( int( 100 * time.time() ) )
         now_str = datetime.datetime.now().strftime( self.now_fmt )
         dirpath_temp = os.path.join( self.dirpathx, '%s_%s' % ( dirname, timetime ) )
         dirpath_final = os.path.join( self.dirpath1, dirname )
-        spray_path = os.path.join( dirpath_temp, SPRAY )
-        if not os.path.isdir( self.dirpath0 ): os.makedirs( self.dirpath0 )
-        if not os.path.isdir( self.dirpath1 ): os.makedirs( self.dirpath1 )
-        if not os.path.isdir( self.dirpathx ): os.makedirs( self.dirpathx )
-        if not os.path.isdir( spray_path    ): os.makedirs( spray_path    )
+        spray_path = os.path.join( dirpath_temp, COLUMNS if self.spray_format()==STORE_NPY else SPRAY )
+        ensure_dir( self.dirpath0 )
+        ensure_dir( self.dirpath1 )
+        ensure_dir( self.dirpathx )
+        ensure_dir( spray_path    )
         contents_path = os.path.join( dirpath_temp, self.contents_filename )
-        with open( contents_path, 'wb' ) as f:
-            f.write( new_contents )
+        link_or_copy( download_path, contents_path )    # Download may be shared; see < Poll >
         with open( os.path.join( dirpath_temp, self.digest_filename ), 'wb' ) as f:
             f.write( new_digest )
+        self.write_validators( dirpath_temp, new_validators )
+        with open( os.path.join( dirpath_temp, self.layout_filename ), 'wb' ) as f:
+            f.write( self.layout() )
         with open( os.path.join( dirpath_temp, self.whenfile_name_fmt % now_str ), 'wb' ) as f:
             f.write( timetime )
         archive_filename = '%s_%s_%s%s' % ( dirname, now_str, timetime, 
@@ -221,6 +448,56 @@ class DiskFile0:
     def spraypath( self ):
         return os.path.join( self.dirpath1, self.dirname, SPRAY )
 
+    def stored_validators( self ):
+        # Validators only count if the snapshot they describe is in the wanted format.
+        path = os.path.join( self.dirpath1, self.dirname, self.validators_filename )
+        if (not os.path.isfile( path )) or self.stored_layout( self.dirname ) != self.layout():
+            return {}
+        with open( path, 'r' ) as f:
+            return json.load( f )
+
+    def write_validators( self, dirpath, validators ):
+        path = os.path.join( dirpath, self.validators_filename )
+        with open( path+'.tmp', 'w' ) as f:
+            json.dump( validators, f )
+        os.rename( path+'.tmp', path )                  # Atomic on Unix
+
+    def spray_format( self ):
+        # < store_format > if set, else the format of the current snapshot, so that a poll
+        # without --store keeps the format chosen by an earlier one; csv if neither.
+        if self.store_format is not None:
+            return self.store_format
+        stored = ( self.stored_layout( self.dirname ) or '' ).split( '.' )[0]
+        return stored if stored in STORE_FORMATS else STORE_CSV
+
+    def layout( self ):
+        return '%s.%d' % ( self.spray_format(), self.layout_version )
+
+    def stored_layout( self, dirname ):
+        # Layout of the current snapshot.  None if it predates layout.txt.
+        path = os.path.join( self.dirpath1, dirname, self.layout_filename )
+        if not os.path.isfile( path ):
+            return None
+        with open( path, 'r' ) as f:
+            return f.read().strip()
+
+    def column_store( self, subdir=COLUMNS ):
+        # Returns None if the current snapshot was sprayed to csv files.
+        # < subdir > is COLUMNS for the geos themselves, ROLLUP for their totals.
+        # The open store is cached, and is replaced when a poll swaps in a new snapshot.
+        meta_path = os.path.join( self.dirpath1, self.dirname, subdir, ColumnStore.meta_filename )
+        try:
+            st = os.stat( meta_path )
+        except OSError:
+            return None
+        stamp = ( st.st_ino, st.st_mtime, st.st_size )
+        if '_column_stores' not in self.__dict__:
+            self._column_stores = {}
+        cached = self._column_stores.get( subdir, None )
+        if cached is None or cached.stamp != stamp:
+            cached = self._column_stores[ subdir ] = ColumnStore( os.path.dirname( meta_path ), stamp )
+        return cached
+
     def get_geotree( self ):
         # Provides Assumption 3774941014: generates fresh copy every time
         with open( os.path.join( self.dirpath1, self.dirname, self.geotree_filename ), 'r' ) as f:
@@ -231,37 +508,314 @@ class DiskFile0:
     def path_to_content_file( self ):
         return os.path.join( self.dirpath1, self.dirname, self.contents_filename )
 
+def ensure_dir( dirpath ):
+    # Tolerates a concurrent poller creating the same directory first.
+    try:
+        os.makedirs( dirpath )
+    except OSError:
+        if not os.path.isdir( dirpath ):
+            raise
+
+def link_or_copy( src_path, dst_path ):
+    try:
+        os.link( src_path, dst_path )
+    except OSError:
+        shutil.copyfile( src_path, dst_path )
+
+def frames_match( df1, df2 ):
+    # Like < DataFrame.equals >, but ignores index and dtype.  So an int column that now 
+    # has a NaN in a new row still matches, as do rows that were re-sorted.
+    if len( df1 ) != len( df2 ) or list( df1.columns ) != list( df2.columns ):
+        return False
+    for colname in df1.columns:
+        a, b = df1[ colname ].values, df2[ colname ].values
+        if not ( (a == b) | (pd.isnull(a) & pd.isnull(b)) ).all():
+            return False
+    return True
+
+def column_key( *parts ):
+    # Geo key used by < ColumnStore >, e.g. 'Canada~Manitoba'.  Null parts become EMPTY.
+    parts = [ EMPTY if (part is None or is_nan(part)) else part for part in parts ]
+    parts = [ part.decode( 'utf-8' ) if isinstance( part, str ) else unicode( part ) for part in parts ]
+    return KEY_SEP.join( parts )
+
+def write_column_store( dirpath, df, key_fields, value_fields, date_field, date_format=None ):
+    """
+    Writes < df > as typed, column-oriented .npy files that < ColumnStore > memory-maps.
+    < df > has one row per geo and date.  Rows are sorted by < key_fields >, then date, so
+    that each geo -- and each prefix of a geo key, e.g. a whole state -- occupies one 
+    contiguous run of rows.  meta.json maps every such key to its [start, stop) row slice.
+    values.npy has one column per value field; dates.npy holds the date of each row.
+    """
+    df = df.copy()
+    for field in key_fields:
+        df[ field ] = df[ field ].fillna( EMPTY )
+    df.sort_values( list( key_fields ) + [date_field], kind='mergesort', inplace=True )
+    dates = pd.to_datetime( df[ date_field ], format=date_format ).values
+    values = df[ value_fields ].values.astype( np.float64 )
+    index = {}
+    n_rows = len( df )
+    for level in range( 1, len( key_fields )+1 ):
+        if not n_rows: break
+        codes = df.groupby( list( key_fields[:level] ), sort=False ).ngroup().values
+        starts = np.flatnonzero( np.r_[ True, codes[1:] != codes[:-1] ] )
+        stops = np.r_[ starts[1:], n_rows ]
+        key_tuples = df[ list( key_fields[:level] ) ].values[ starts ]
+        for key_tuple, start, stop in zip( key_tuples, starts, stops ):
+            index[ column_key( *key_tuple ) ] = [ int(start), int(stop) ]
+    np.save( os.path.join( dirpath, ColumnStore.values_filename ), values )
+    np.save( os.path.join( dirpath, ColumnStore.dates_filename ), dates )
+    meta = { 'key_fields': list( key_fields ), 'value_fields': list( value_fields ), 'index': index }
+    with open( os.path.join( dirpath, ColumnStore.meta_filename ), 'w' ) as f:
+        json.dump( meta, f )
+    return index
+
+class ColumnStore:
+    """
+    Read side of < write_column_store >.  The arrays are memory-mapped, so a lookup is
+    a dict access plus a slice; nothing is parsed.
+    """
+    meta_filename   = 'meta.json'
+    values_filename = 'values.npy'
+    dates_filename  = 'dates.npy'
+
+    def __init__( self, dirpath, stamp=None ):
+        self.stamp = stamp
+        with open( os.path.join( dirpath, self.meta_filename ), 'r' ) as f:
+            meta = json.load( f )
+        self.index = meta[ 'index' ]
+        self.value_fields = meta[ 'value_fields' ]
+        self.values = np.load( os.path.join( dirpath, self.values_filename ), mmap_mode='r' )
+        self.dates  = np.load( os.path.join( dirpath, self.dates_filename  ), mmap_mode='r' )
+
+    def frame( self, *key_parts ):
+        # Returns None if there is no data for the geo.
+        span = self.index.get( column_key( *key_parts ), None )
+        if span is None:
+            return None
+        start, stop = span
+        return pd.DataFrame( np.array( self.values[ start:stop ] ),
+                             index=pd.DatetimeIndex( self.dates[ start:stop ] ),
+                             columns=self.value_fields )
+
+def write_geo_matrix( dirpath, frames, value_fields, date_field, date_format=None ):
+    """
+    Writes dense geo-by-day matrices that < GeoMatrix > loads.  < value field >.npy has 
+    one row per geo and one column per day, from the first date to the last, with NaN 
+    where a geo has no value.  geos.json lists the geo triple of each row and dates.npy 
+    the day of each column.  < frames > is a list of ( df, key_fields, prefix ) triples:
+    each row of df belongs to the geo < prefix > + its < key_fields > values.  Rows whose 
+    last key is null are skipped, since in a geo triple EMPTY stands for the parent geo.
+    """
+    geos, row_parts, day_parts, value_parts = [], [], [], []
+    for df, key_fields, prefix in frames:
+        key_fields = list( key_fields )
+        df = df[ df[ key_fields[-1] ].notnull().values ]
+        if not len( df ):
+            continue
+        codes = df.groupby( key_fields, sort=False ).ngroup().values
+        _, firsts = np.unique( codes, return_index=True )
+        for key_tuple in df[ key_fields ].values[ firsts ]:
+            geo = list( prefix ) + column_key( *key_tuple ).split( KEY_SEP )
+            geos.append( tuple( geo + [ EMPTY ] * ( 3 - len( geo ) ) ) )
+        row_parts.append( codes + ( len( geos ) - len( firsts ) ) )
+        day_parts.append( pd.to_datetime( df[ date_field ], format=date_format ).values.astype( 'datetime64[D]' ) )
+        value_parts.append( df[ value_fields ].values.astype( np.float64 ) )
+    if geos:
+        rows, days = np.concatenate( row_parts ), np.concatenate( day_parts )
+        values = np.concatenate( value_parts )
+        first_day = days.min()
+        dates = np.arange( first_day, days.max() + 1 )
+        cols = ( days - first_day ).astype( np.int64 )
+    else:
+        rows = cols = np.zeros( 0, dtype=np.int64 )
+        values = np.zeros( ( 0, len( value_fields ) ) )
+        dates = np.zeros( 0, dtype='datetime64[D]' )
+    for k, field in enumerate( value_fields ):
+        matrix = np.full( ( len( geos ), len( dates ) ), np.nan )
+        matrix[ rows, cols ] = values[ :, k ]
+        np.save( os.path.join( dirpath, field + '.npy' ), matrix )
+    np.save( os.path.join( dirpath, GeoMatrix.dates_filename ), dates )
+    with open( os.path.join( dirpath, GeoMatrix.geos_filename ), 'w' ) as f:
+        json.dump( geos, f )
+
+class GeoMatrix:
+    """
+    Dense geo-by-day values of one series.  < values >[ i, j ] is the value for the geo 
+    < geos >[ i ], a ( nation, state, county ) triple, on day < dates >[ j ]; NaN if none.
+    < index > maps geo keys, e.g. 'USA~Texas~', to row numbers.  Read side of 
+    < write_geo_matrix >; see < Series.matrix >.
+    """
+    geos_filename  = 'geos.json'
+    dates_filename = 'dates.npy'
+
+    def __init__( self, geos, dates, values ):
+        self.geos = geos
+        self.dates = dates
+        self.values = values
+        self.index = {}
+        for i, geo in enumerate( geos ):
+            self.index.setdefault( column_key( *geo ), i )
+
+    @classmethod
+    def Load( _, dirpath, series_name ):
+        # Returns None if the snapshot has no matrix for the series.
+        path = os.path.join( dirpath, series_name + '.npy' )
+        if not os.path.isfile( path ):
+            return None
+        with open( os.path.join( dirpath, GeoMatrix.geos_filename ), 'r' ) as f:
+            geos = [ tuple( geo ) for geo in json.load( f ) ]
+        dates = pd.DatetimeIndex( np.load( os.path.join( dirpath, GeoMatrix.dates_filename ) ) )
+        return GeoMatrix( geos, dates, np.load( path ) )
+
+    @classmethod
+    def Stack( _, matrices ):
+        # One matrix with the rows of all < matrices >, on the union of their date axes.
+        matrices = [ m for m in matrices if m is not None ]
+        if len( matrices ) <= 1:
+            return matrices[0] if matrices else None
+        dated = [ m for m in matrices if len( m.dates ) ]
+        if not dated:
+            # No values at all: the rows of all, with no days, as one such matrix would be.
+            return GeoMatrix( [ geo for m in matrices for geo in m.geos ], pd.DatetimeIndex( [] ),
+                              np.full( ( sum( len( m.geos ) for m in matrices ), 0 ), np.nan ) )
+        first_day = min( m.dates[0] for m in dated )
+        dates = pd.date_range( first_day, max( m.dates[-1] for m in dated ), freq='D' )
+        values = np.full( ( sum( len( m.geos ) for m in matrices ), len( dates ) ), np.nan )
+        row = 0
+        for m in matrices:
+            if len( m.dates ):
+                col = ( m.dates[0] - first_day ).days
+                values[ row:row+len( m.geos ), col:col+len( m.dates ) ] = m.values
+            row += len( m.geos )
+        return GeoMatrix( [ geo for m in matrices for geo in m.geos ], dates, values )
+
+    def row_id( self, geo_triple ):
+        # Returns None if the geo has no row.
+        return self.index.get( column_key( *[ part or EMPTY for part in geo_triple ] ), None )
+
+    def rows( self, geo_triples ):
+        # Matrix of the rows for < geo_triples >, in order.  Raises KeyError for unknown geos.
+        ids = []
+        for geo_triple in geo_triples:
+            i = self.row_id( geo_triple )
+            if i is None:
+                raise KeyError( geo_triple )
+            ids.append( i )
+        return self.values[ ids ]
+
+    def series( self, geo_triple ):
+        # The row for < geo_triple > as a date-indexed pandas Series, or None.
+        i = self.row_id( geo_triple )
+        return None if i is None else pd.Series( self.values[ i ], index=self.dates )
+
+class NilException( Exception ): pass
+
+_THREAD_LOCAL = threading.local()
+
+def http_session():
+    # Keep-alive connections to the (few) upstream hosts, one session per polling thread.
+    if not hasattr( _THREAD_LOCAL, 'session' ):
+        _THREAD_LOCAL.session = requests.Session()
+    return _THREAD_LOCAL.session
+
+class Download:
+    """
+    Result of < WebSource._grab_contents_from_web >.  < path > is a temporary file in vDATAx
+    holding the payload, or None if the server answered 304 Not Modified.  
+    < sent_validators > are the validators the request was conditional on.
+    """
+    chunk_size = 1 << 20
+
+    def __init__( self, path, digest, validators, sent_validators ):
+        self.path = path
+        self.digest = digest
+        self.validators = validators
+        self.sent_validators = sent_validators
+
+    def discard( self ):
+        if self.path is not None and os.path.isfile( self.path ):
+            os.remove( self.path )
+
+def _poll_job( job ):
+    # Polls, one after another, the sources that share a url.  Module-level for pickling.
+    indexes, is_production = job
+    # Use NilException when debugging because it allows full traceback to be printed.
+    exception_class = Exception if is_production else NilException
+    grabbed = None
+    oks = []
+    for i in indexes:
+        instance = WebSource.WebSourcesToPoll[ i ]
+        source_printname = instance.__class__.__name__
+        print 'Starting check of', source_printname
+        try:
+            grabbed = instance.poll( grabbed )
+            print 'Finished check of', source_printname
+            oks.append( True )
+        except exception_class:
+            print 'Failed with check of', source_printname
+            oks.append( False )
+    if grabbed is not None:
+        grabbed.discard()
+    return oks
+
 class WebSource( Source, DiskFile0 ):
     WebSourcesToPoll = []
+    poll_workers = 4        # Sources polled concurrently by < Poll >.  1 = one after another.
+    poll_processes = False  # True = poll in a process pool rather than a thread pool
+    ingest_incremental = False  # True = append new dates to the csv snapshot if possible
+    spray_threads = 4       # Threads writing csv spray files
+    geo_levels = ( 2, )     # Levels of geotree served: 1 = nations, 2 = states, 3 = counties
+    geo_prefix = ( USA, )   # Prepended to < column_keys > values to make geo triples
 
     def init2( self ):
         WebSource.WebSourcesToPoll.append( self )
     
     @classmethod
-    def Poll( cls, is_production=False ):
-        # Use NilException when debugging because it allows full traceback to be printed.
-        class NilException(Exception): pass
-        exception_class = Exception if is_production else NilException
-        all_ok = True
-        for instance in WebSource.WebSourcesToPoll:
-            source_printname = instance.__class__.__name__
-            print 'Starting check of', source_printname
+    def Poll( cls, is_production=False, workers=None, processes=None ):
+        # Sources that share a url (e.g. the CTP family) form one job, so the url is 
+        # downloaded once.  Jobs run concurrently in a pool of < workers > threads, or
+        # processes if < processes >.  Each source still swaps in its snapshot atomically.
+        workers = cls.poll_workers if workers is None else workers
+        processes = cls.poll_processes if processes is None else processes
+        url2indexes = collections.OrderedDict()
+        for i, instance in enumerate( WebSource.WebSourcesToPoll ):
+            url2indexes.setdefault( instance.url, [] ).append( i )
+        jobs = [ ( indexes, is_production ) for indexes in url2indexes.values() ]
+        time0 = time.time()
+        if workers <= 1:
+            results = map( _poll_job, jobs )
+        else:
+            pool = ( multiprocessing.Pool if processes else multiprocessing.pool.ThreadPool )( workers )
             try:
-                instance.poll()
-                print 'Finished check of', source_printname
-            except exception_class:
-                print 'Failed with check of', source_printname
-                all_ok = False
-        return all_ok
-    
-    def poll( self ):
+                results = pool.map( _poll_job, jobs, chunksize=1 )
+            finally:
+                pool.close()
+                pool.join()
+        print 'Finished checking %d sources in %.2f sec' % ( len( WebSource.WebSourcesToPoll ), time.time()-time0 )
+        return all( all( oks ) for oks in results )
+
+    def poll( self, grabbed=None ):
+        # < grabbed > is the < Download > made for a source sharing the same url.
+        # Returns the < Download > used, so that the next such source can reuse it.
+        # The caller must < discard > it when done.
+        source_printname = self.__class__.__name__
+        download = grabbed
         try:
-            content, digest = self._grab_contents_from_web()
-            contents_path, dirpath_temp, dirpath_final, spray_dirpath = self.pre_spray( self.dirname, content, digest )
+            validators = self.stored_validators()
+            if download is None or download.sent_validators != validators:
+                download = self._grab_contents_from_web( validators )
+            if download.path is None:
+                print 'Not modified on web:', source_printname
+                contents_path = None
+            else:
+                contents_path, dirpath_temp, dirpath_final, spray_dirpath = \
+                    self.pre_spray( self.dirname, download.path, download.digest, download.validators )
             if contents_path is not None:
-                source_printname = self.__class__.__name__
                 print 'Starting spray of', source_printname, '***'
-                geotree = self.spray_and_geotree( content, spray_dirpath )     # raises Exception if problem
+                time0 = time.time()
+                geotree = self.spray_and_geotree( contents_path, spray_dirpath )     # raises Exception if problem
+                seconds = time.time() - time0
                 with open( os.path.join( dirpath_temp, self.geotree_filename ), 'w' ) as f:
                     json.dump( geotree, f )
                 if os.path.isdir( dirpath_final ):
@@ -270,30 +824,185 @@ class WebSource( Source, DiskFile0 ):
                     shutil.rmtree( dirpath_final+'xx' )
                 else:
                     os.rename( dirpath_temp, dirpath_final )      # Atomic on Unix
-                print 'Finished spray of', source_printname
+                Snapshots.bump()
+                print 'Finished spray of %s: %d rows in %.2f sec (%d rows/sec)' % ( 
+                      source_printname, self.spray_rows, seconds, self.spray_rows / max( seconds, 1e-6 ) )
         except Exception as e:
             print 'Failed with spray of', source_printname,   # Send Slack message?
             print '******', e
+            if download is not grabbed:
+                download.discard()
             raise
+        if download is not grabbed and grabbed is not None:
+            grabbed.discard()
+        return download
+
+    # The spray stage.  Subclasses supply < spray_df >, which parses contents.csv into long
+    # format (one row per geo and date), and < geotree_from_partitions >.  They may override 
+    # < partitions > and < rollup_df >.  < date_field > names the date column.
+    date_field = None
+    date_format = None
+
+    def spray_and_geotree( self, contents_path, spray_dirpath ):
+        df = self.spray_df( contents_path )
+        self.spray_rows = len( df )
+        partitions = self.partitions( df )
+        rollup = self.rollup_df( df )
+        rollup_dirpath = os.path.join( os.path.dirname( spray_dirpath ), ROLLUP )
+        if self.spray_format() == STORE_NPY:
+            self.write_columns( partitions, spray_dirpath, self.column_keys )
+            if rollup is not None:
+                ensure_dir( rollup_dirpath )
+                self.write_columns( [ (None, rollup) ], rollup_dirpath, self.column_keys[:1] )
+        else:
+            appended = self.appended_rows( df ) if self.ingest_incremental else None
+            if appended is None:
+                self.spray_partitions( partitions, spray_dirpath )
+            else:
+                self.append_partitions( partitions, appended, spray_dirpath )
+            if rollup is not None:
+                # Rollups are small, so even incremental ingest rewrites them in full.
+                ensure_dir( rollup_dirpath )
+                self.spray_partitions( list( rollup.groupby( self.spray_field, sort=False ) ), rollup_dirpath )
+        self.write_matrix( partitions, rollup, os.path.join( os.path.dirname( spray_dirpath ), MATRIX ) )
+        return self.geotree_from_partitions( partitions )
 
-    def _grab_contents_from_web( self ):
-        r = requests.get( self.url )
-        #print 4949, r.content
-        m = md5.new()
-        m.update( r.content )
-        digest = m.hexdigest()
-        return r.content, digest
-
-    def dataframe_from_csv_string( self, s ):
-        f = StringIO.StringIO()
-        f.write( s )
-        f.seek(0)
-        dataframe = pd.read_csv( f )
-        return dataframe
+    def partitions( self, df ):
+        # Returns a list of ( unique, dataframe ) pairs, one per spray file.  One pass.
+        return list( df.groupby( self.spray_field, sort=False ) )
+
+    def geo_triples( self, geotree ):
+        # The ( nation, state, county ) triples this source serves, with EMPTY for absent
+        # parts.  In < geotree > an EMPTY key or county stands for its parent, not a geo.
+        triples = []
+        for nation, states in geotree.items():
+            if 1 in self.geo_levels:
+                triples.append( ( nation, EMPTY, EMPTY ) )
+            for state, counties in states.items():
+                if state == EMPTY:
+                    continue
+                if 2 in self.geo_levels:
+                    triples.append( ( nation, state, EMPTY ) )
+                if 3 in self.geo_levels and isinstance( counties, list ):
+                    triples.extend( ( nation, state, county ) for county in counties if county != EMPTY )
+        return triples
+
+    def rollup_df( self, df ):
+        # Totals for the geos that are sums of other geos (e.g. states of counties), 
+        # stored at ingest so that requests for them need no summing.  None = no such geos.
+        return None
+
+    def write_matrix( self, partitions, rollup, matrix_dirpath ):
+        # The geo-by-day matrices hold the same geos as < geo_triples >, so they are 
+        # rewritten in full even by incremental ingest.
+        frames = []
+        if partitions:
+            frames.append( ( pd.concat([ part_df for _, part_df in partitions ]), self.column_keys, self.geo_prefix ) )
+        if rollup is not None:
+            frames.append( ( rollup, self.column_keys[:1], self.geo_prefix ) )
+        ensure_dir( matrix_dirpath )
+        write_geo_matrix( matrix_dirpath, frames, self.series_names, self.date_field, self.date_format )
+
+    def write_columns( self, partitions, columns_dirpath, key_fields ):
+        if partitions:
+            write_column_store( columns_dirpath, pd.concat([ part_df for _, part_df in partitions ]),
+                                key_fields, self.series_names, self.date_field, self.date_format )
+
+    def appended_rows( self, df ):
+        # Diffs the new, tidied payload against the current snapshot.  If the new payload 
+        # is the old one plus rows for later dates, returns just those rows.  Returns None 
+        # if a full rebuild is needed: history was revised, columns changed, etc.
+        old_contents_path = self.path_to_content_file()
+        if (self.date_field is None) or (not os.path.isfile( old_contents_path )) \
+                                     or self.stored_layout( self.dirname ) != self.layout():
+            return None
+        old_df = self.spray_df( old_contents_path )
+        if list( old_df.columns ) != list( df.columns ):
+            return None
+        is_new = df[ self.date_field ] > old_df[ self.date_field ].max()
+        order = list( self.column_keys ) + [ self.date_field ]
+        if not frames_match( old_df.sort_values( order, kind='mergesort' ), 
+                             df[ ~is_new ].sort_values( order, kind='mergesort' ) ):
+            print 'History revised, so full rebuild of', self.__class__.__name__
+            return None
+        return df[ is_new ]
+
+    def append_partitions( self, partitions, appended, spray_dirpath ):
+        # Incremental counterpart of < spray_partitions >.  Unaffected files are hard-linked
+        # from the current snapshot.  Affected files are copied and the new rows appended.
+        old_spray_dirpath = self.spraypath()
+        unique2appended = dict( list( appended.groupby( self.spray_field, sort=False ) ) )
+        def write( partition ):
+            unique, part_df = partition
+            filename = unique2filename( unique )
+            old_path = os.path.join( old_spray_dirpath, filename )
+            new_path = os.path.join( spray_dirpath, filename )
+            if not os.path.isfile( old_path ):
+                part_df.to_csv( new_path )
+            elif unique in unique2appended:
+                shutil.copyfile( old_path, new_path )       # Never append through a link
+                unique2appended[ unique ].to_csv( new_path, mode='a', header=False )
+            else:
+                link_or_copy( old_path, new_path )
+        self.map_in_threads( write, partitions )
+        print 'Appended %d rows to %d of %d partitions of %s' % ( len( appended ), 
+              len( unique2appended ), len( partitions ), self.__class__.__name__ )
+
+    def spray_partitions( self, partitions, spray_dirpath ):
+        # < partitions > is a list of ( unique, dataframe ) pairs, each written to its own file.
+        def write( partition ):
+            unique, part_df = partition
+            part_df.to_csv( os.path.join( spray_dirpath, unique2filename(unique) ) )
+        self.map_in_threads( write, partitions )
+
+    def map_in_threads( self, func, items ):
+        # Writing spray files is mostly file I/O, so threads overlap well.
+        pool = multiprocessing.pool.ThreadPool( self.spray_threads )
+        try:
+            return pool.map( func, items )
+        finally:
+            pool.close()
+            pool.join()
+
+    def _grab_contents_from_web( self, validators ):
+        # Conditional GET.  A changed payload is streamed to a file in vDATAx in chunks,
+        # and hashed on the fly, so memory use is bounded by < Download.chunk_size >.
+        headers = { 'Accept-Encoding': 'gzip, deflate' }    # < iter_content > decodes
+        if validators.get( 'etag' ):
+            headers[ 'If-None-Match' ] = validators[ 'etag' ]
+        if validators.get( 'last_modified' ):
+            headers[ 'If-Modified-Since' ] = validators[ 'last_modified' ]
+        r = http_session().get( self.url, headers=headers, stream=True )
+        try:
+            if r.status_code == 304:
+                return Download( None, None, validators, validators )
+            r.raise_for_status()
+            ensure_dir( self.dirpathx )
+            path = os.path.join( self.dirpathx, '%s_%d.download' % ( self.dirname, int( 100 * time.time() ) ) )
+            m = md5.new()
+            try:
+                with open( path, 'wb' ) as f:
+                    for chunk in r.iter_content( Download.chunk_size ):
+                        m.update( chunk )
+                        f.write( chunk )
+            except:
+                # No Download is returned, so nothing else would remove the partial file.
+                if os.path.isfile( path ):
+                    os.remove( path )
+                raise
+        finally:
+            r.close()
+        new_validators = { 'etag': r.headers.get( 'ETag' ), 
+                           'last_modified': r.headers.get( 'Last-Modified' ) }
+        new_validators = { k: v for k, v in new_validators.items() if v }
+        return Download( path, m.hexdigest(), new_validators, validators )
+
+    def dataframe_from_csv_file( self, path ):
+        return pd.read_csv( path )
    
-    def _slurp_df_from_disk( self, geo_name ):
+    def _slurp_df_from_disk( self, geo_name, subdir=SPRAY ):
         path = self.geoname2path.get( canonize_geoname( geo_name ), None )
-        path = os.path.join( self.dirpath1, self.dirname, SPRAY, geo_name + '.csv' )
+        path = os.path.join( self.dirpath1, self.dirname, subdir, geo_name + '.csv' )
         #print 479244, path
         if path is None:
             raise Exception( 'No data for %s / %s' % ( self.series_names, geo_name ) )
@@ -317,27 +1026,34 @@ class CTP_States( CTP ):
     url = 'https://covidtracking.com/api/v1/states/daily.csv'
     dirname = 'ctp_us_states'
     spray_field = 'k8state'
+    date_field = 'YYYYMMDD'
+    date_format = '%Y%m%d'
+    column_keys = ( spray_field, )
     n_geos_in_spec = 1
 
-    def spray_and_geotree( self, content, spray_dirpath ):
-        df = self.dataframe_from_csv_string( content )
+    def spray_df( self, contents_path ):
+        df = self.dataframe_from_csv_file( contents_path )
         df.rename(columns=self.renames, inplace=True )
         df = df.replace({ 'k8state': util3.STATE_ABBREV })
         df.sort_values( 'YYYYMMDD', ascending=True, inplace=True )
-        geotree = {}
-        for unique in df[ self.spray_field ].unique():
-            outpath = os.path.join( spray_dirpath, unique2filename(unique) )
-            state_df = df[ df[ self.spray_field ]==unique ]
-            if len( self.series_names ) == 1:
-                # Expression on right gave warning if performed with < inplace=True >.
-                state_df = state_df.dropna( subset=self.series_names, how='all', inplace=False )
-            # Don't write a file unless there is actually some data to write
-            if len(state_df)>1:                 # >1 because we need that many for a trend
-                state_df.to_csv( outpath )
-                geotree[ unique ] = EMPTY
-        return { USA: geotree }
+        if len( self.series_names ) == 1:
+            # Expression on right gave warning if performed with < inplace=True >.
+            df = df.dropna( subset=self.series_names, how='all', inplace=False )
+        return df
+
+    def partitions( self, df ):
+        # Don't write a file unless there is actually some data to write
+        return [ ( unique, state_df ) 
+                 for unique, state_df in df.groupby( self.spray_field, sort=False ) 
+                 if len(state_df)>1 ]     # >1 because we need that many for a trend
+
+    def geotree_from_partitions( self, partitions ):
+        return { USA: { unique: EMPTY for unique, _ in partitions } }
 
     def get_df3_from_disk( self, nation, state, county ):
+        store = self.column_store()
+        if store is not None:
+            return store.frame( state )
         df = self._slurp_df_from_disk( state )
         #print 8803, df.head()
         df.index = pd.to_datetime( df.YYYYMMDD, format='%Y%m%d' )
@@ -362,22 +1078,24 @@ class NYT( WebSource ):
     hide_name = ['USA',]
     full_source_sortnum_and_name = (2, 'New York Times')
 
-    def spray_and_geotree( self, content, spray_dirpath ):
-        df = self.dataframe_from_csv_string( content )
+    date_field = 'date'
+    date_format = '%Y-%m-%d'
+
+    def spray_df( self, contents_path ):
+        df = self.dataframe_from_csv_file( contents_path )
         df.rename(columns=self.renames, inplace=True )
-        geotree = {}
-        for unique in df[ self.spray_field ].unique():
-            outpath = os.path.join( spray_dirpath, unique2filename(unique) )
-            state_df = df[ df[ self.spray_field ]==unique ]
-            state_df.to_csv( outpath )
-            geotree[ unique ] = self.make_county_list( state_df )
-        return { USA: geotree }
+        return df
+
+    def geotree_from_partitions( self, partitions ):
+        return { USA: { unique: self.make_county_list( state_df ) for unique, state_df in partitions } }
  
 class NYT_Counties( NYT ):
     url = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
     dirname = 'nyt_us_counties'
     spray_field = 'k8state'
     hemi1_field = 'k8county'
+    column_keys = ( spray_field, hemi1_field )
+    geo_levels = ( 3, )
     #lookups = 'NMU'
 
     def make_county_list( self, state_df ):
@@ -385,6 +1103,9 @@ class NYT_Counties( NYT ):
 
     def get_df3_from_disk( self, nation, state, county ):
         if state and county:
+            store = self.column_store()
+            if store is not None:
+                return store.frame( state, county )
             df = self._slurp_df_from_disk( state )
             df.index = pd.to_datetime( df.date )
             return df[ df[self.hemi1_field]==county ]
@@ -393,6 +1114,7 @@ class NYT_States( NYT ):
     url = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-states.csv'
     dirname = 'nyt_us_states'
     spray_field = 'k8state'
+    column_keys = ( spray_field, )
     n_geos_in_spec = 1
     #lookups = 'EMU'
 
@@ -401,6 +1123,9 @@ class NYT_States( NYT ):
 
     def get_df3_from_disk( self, nation, state, county ):
         if state and not county:
+            store = self.column_store()
+            if store is not None:
+                return store.frame( state )
             df = self._slurp_df_from_disk( state )
             #print 8803, df.head()
             df.index = pd.to_datetime( df.date )
@@ -411,45 +1136,37 @@ class JHU( WebSource ):
     hide_box = ['USA',]
     hide_name = ['US']
     full_source_sortnum_and_name = (1, 'Johns Hopkins University')
+    date_field = 'date'
+    date_format = '%Y-%m-%d'
+    jhu_date_fmt = '%m/%d/%y'
 
-    def spray_and_geotree( self, content, spray_dirpath ):
-        df = self.dataframe_from_csv_string( content )
+    def spray_df( self, contents_path ):
+        # JHU publishes wide rows: hemi1, hemi2, date1, date2, date3, ....
+        # Melt them once, here, into long rows: hemi1, hemi2, date, n -- the same shape as
+        # NYT -- so requests need no transposing and new dates are appended rows.
+        df = self.dataframe_from_csv_file( contents_path )
         df.rename(columns=self.renames, inplace=True )
-        for colname in df.columns:
-            if (colname[0] not in '0123456789') and (colname not in (self.hemi1_field,self.spray_field)):
-                del df[colname]
-        geotree_pairs = []
-        for unique in df[ self.spray_field ].unique():
-            outpath = os.path.join( spray_dirpath, unique2filename(unique) )
-            #df1 = self._transpose( df[ df[ self.spray_field ]==unique ] )
-            df1 = df[ df[ self.spray_field ]==unique ]
-            df1.to_csv( outpath )
-            geotree_pairs.append( (unique, list( df1[self.hemi1_field].unique() ) ) )
-        return self.make_geotree( geotree_pairs )
-
-    def _transpose_row_neo( self, df0, series_name, geo_name ):
-        # Each row has format: hemi1, hemi2, date1, date2, date3, ....
-        # So iterate across [2:] to drop hemi2, which is not needed because is in filename.
-        df_rows = []
-        for _, row in df0.iterrows():
-            for date, n in zip( df0.columns[3:], row[3:] ):
-                df_rows.append( ( date, geo_name, n ) )
-        df = pd.DataFrame( df_rows, columns=['DATESTRING', 'REFNAME', series_name] )
-        df.index = pd.to_datetime( df.DATESTRING )
-        #print 8381203, df.columns
-        #print df
+        # Assumption 4729424: Non-date columns cannot start with digit
+        date_fields = [ colname for colname in df.columns if colname[0] in '0123456789' ]
+        df = pd.melt( df, id_vars=[ self.spray_field, self.hemi1_field ], value_vars=date_fields,
+                      var_name=self.date_field, value_name=self.series_names[0] )
+        # Dates become ISO strings: they sort chronologically and parse quickly with a format.
+        iso_dates = pd.to_datetime( date_fields, format=self.jhu_date_fmt ).strftime( self.date_format )
+        df[ self.date_field ] = df[ self.date_field ].map( dict( zip( date_fields, iso_dates ) ) )
         return df
 
-    def sum_df( self, df ):
-        # Assumption 4729424: Non-date columns cannot start with digit
-        for first_date, colname in enumerate( df.columns ):
-            if colname[0] in '0123456789': break
-        series = df.sum( numeric_only=False )[ first_date: ]  # < True > would strip dates
-        df2 = pd.DataFrame( series )
-        df2.index = pd.to_datetime( df2.index )
-        df2.columns = self.series_names[:1]
-        #print 7333, type(df), type(df2), df2.head()
-        return df2
+    def geotree_from_partitions( self, partitions ):
+        return self.make_geotree([ ( unique, list( df1[self.hemi1_field].unique() ) ) 
+                                   for unique, df1 in partitions ])
+
+    def rollup_df( self, df ):
+        # One vectorized pass: for each spray_field value (state or nation) and date, 
+        # the sum over its hemi1 rows (counties or provinces).
+        return df.groupby( [ self.spray_field, self.date_field ], sort=False )[ self.series_names ].sum().reset_index()
+
+    def _dated( self, df ):
+        df.index = pd.to_datetime( df[ self.date_field ], format=self.date_format )
+        return df
 
 class JHU_Cases_Counties( JHU ):
     url = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_US.csv'
@@ -457,6 +1174,8 @@ class JHU_Cases_Counties( JHU ):
     renames = { 'Province_State':'k8state', 'Admin2':'k8county' }
     spray_field = 'k8state'    # Assumption 4729424: Cannot start with digit
     hemi1_field = 'k8county'   # Assumption 4729424: Cannot start with digit
+    column_keys = ( spray_field, hemi1_field )
+    geo_levels = ( 2, 3 )      # States are served from ROLLUP
     
     series_names = ['cases_JHU',]
     #lookups = 'NMU'
@@ -466,26 +1185,14 @@ class JHU_Cases_Counties( JHU ):
 
     def get_df3_from_disk( self, nation, state, county ):
         if state and (nation==USA):
-            df = self._slurp_df_from_disk( state )
+            # State total is sum of all rows for the state, precomputed in ROLLUP.
+            store = self.column_store( COLUMNS if county else ROLLUP )
+            if store is not None:
+                return store.frame( state, county ) if county else store.frame( state )
             if county:
-                df = df[ df[self.hemi1_field]==county ]
-                df = self._transpose_row_neo( df, self.series_names[0], county )
-            else:
-                # State total is sum of all rows for the state.
-                # The < sum > method yields a dataframe, includes non-numeric cells, too.
-                # (Saying numeric=True would yield series sans dates -- useless.)
-                #
-                # However, we'll need to remove cells that don't derive from a date.
-                # Assumption 4729424: Non-date columns cannot start with digit
-                for first_date, colname in enumerate( df.columns ):
-                    if colname[0] in '0123456789': break
-                series = df.sum( numeric_only=False )[first_date:]  # < True > would strip dates
-                df2 = pd.DataFrame( series )
-                df2.index = pd.to_datetime( df2.index )
-                df2.columns = self.series_names[:1]
-                #print 7333, type(df), type(df2), df2.head()
-                df = df2
-            return df
+                df = self._slurp_df_from_disk( state )
+                return self._dated( df[ df[self.hemi1_field]==county ] )
+            return self._dated( self._slurp_df_from_disk( state, ROLLUP ) )
 
 class JHU_Cases_Nations( JHU ):
     url = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
@@ -493,6 +1200,9 @@ class JHU_Cases_Nations( JHU ):
     renames = { 'Province/State':'k8state', 'Country/Region':'k8country' }
     spray_field = 'k8country'
     hemi1_field = 'k8state'
+    column_keys = ( spray_field, hemi1_field )
+    geo_levels = ( 1, 2 )      # Nations are served from ROLLUP
+    geo_prefix = ()
     
     series_names = ['cases_JHU',]
     #lookups = 'EOM'
@@ -502,32 +1212,26 @@ class JHU_Cases_Nations( JHU ):
                            for region in regionlist }
                  for nation, regionlist in nation_regionlist_pairs }
 
+    def rollup_df( self, df ):
+        # A nation's total is its own (null-province) row if it has one, else the sum of
+        # its provinces.
+        is_own = df[ self.hemi1_field ].isnull()
+        own_nations = df.loc[ is_own, self.spray_field ].unique()
+        summed = JHU.rollup_df( self, df[ ~df[ self.spray_field ].isin( own_nations ) ] )
+        return pd.concat([ df.loc[ is_own, summed.columns ], summed ])
+
     def get_df3_from_disk( self, nation, state, county ):
         #print 8880, self, nation, state, county
         if (not county) and (nation != USA):
-            df = self._slurp_df_from_disk( nation )
-            #print 8881,  nation, state, county, df
+            # Nation total is precomputed in ROLLUP; see < rollup_df >.
+            store = self.column_store( COLUMNS if state else ROLLUP )
+            if store is not None:
+                return store.frame( nation, state ) if state else store.frame( nation )
             if state:
-                df2 = df[ df[self.hemi1_field]==state ]
-                df = self._transpose_row_neo( df2, self.series_names[0], state )
-            else:
-                df2 = df[ df[self.hemi1_field].isnull() ]
-                if len(df2)==0:
-                    df = self.sum_df( df )
-                else:
-                    df = self._transpose_row_neo( df2, self.series_names[0], state )
-            #print 8883,  nation, state, county, df
-            return df
-
-    def get_df3_from_diskOOOO( self, nation, state, county ):
-        #print 8880, self, nation, state, county
-        if (not county) and (nation != USA):
-            df = self._slurp_df_from_disk( nation )
-            #print 8881,  nation, state, county, df
-            df = df[ df[self.hemi1_field]==state ] if state else df[ df[self.hemi1_field].isnull() ]
-            #print 8883,  nation, state, county, df
-            df = self._transpose_row_neo( df, self.series_names[0], state or nation )
-            return df
+                df = self._slurp_df_from_disk( nation )
+                #print 8881,  nation, state, county, df
+                return self._dated( df[ df[self.hemi1_field]==state ] )
+            return self._dated( self._slurp_df_from_disk( nation, ROLLUP ) )
 
 class JHU_Deaths_Counties( JHU_Cases_Counties ):
     url = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv'
@@ -554,9 +1258,17 @@ JHU_Cases_Nations()
 JHU_Deaths_Counties()
 JHU_Deaths_Nations()
 
-def check_for_new_web_sources( is_production=False ):
+def check_for_new_web_sources( is_production=False, store_format=None, workers=None, processes=None,
+                               incremental=None ):
     # < is_production > affects only error notifications
-    return WebSource.Poll( is_production=is_production )
+    # < store_format > is one of STORE_FORMATS; None keeps each source's stored format (csv if none)
+    # < workers > and < processes > default to WebSource.poll_workers / poll_processes
+    # < incremental > default to WebSource.ingest_incremental
+    if store_format is not None:
+        DiskFile0.store_format = store_format
+    if incremental is not None:
+        WebSource.ingest_incremental = incremental
+    return WebSource.Poll( is_production=is_production, workers=workers, processes=processes )
 
 if __name__=='__main__':
     check_for_new_web_sources()
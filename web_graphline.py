@@ -1,7 +1,10 @@
-import copy
 import math
+import time
+import os
+import md5
+import sqlite3
+import threading
 
-import scipy.optimize
 import pandas
 import numpy as np
 
@@ -11,62 +14,468 @@ DEFAULT_LEFTTIME = 21
 DEFAULT_LABEL_HALIGN = 'left'
 DEFAULT_LABEL_VALIGN = 'center'
 
+# Same layout as < web_grab.SUPERDIR_PATH >: cron and web server share the directory.
+FIT_CACHE_PATH = os.path.join( os.path.abspath( os.path.join( os.path.abspath( __file__ ), '../..' ) ),
+                               'vCACHE', 'fits.sqlite' )
+
 def stamp2daynum( timestamp ):
     return timestamp.toordinal()
     
 def daynum2stamp( daynum ):
     return pandas.Timestamp.fromordinal( daynum )
 
+class FitCache:
+    """
+    Fit parameters shared on disk by every process (web server, plot subprocesses, cron),
+    in one SQLite file.  Rows are keyed by a hash of the fit kind, the window's dates and
+    values, and any other fit input, so a window is fitted once until its data change.
+    Only parameters are stored; the extrapolated series is cheap to rebuild from them.
+    At most < max_rows > rows are kept, least recently used first out.  Hits do not
+    write their use time at once: the keys are gathered and written in one transaction
+    with the next < put_many >, or once < touch_batch > have gathered, so that a lookup
+    that finds everything is read-only.  A SQLite error (e.g. a locked or read-only
+    file) costs only a miss.
+    """
+    version = 2                 # Bump when a fit engine change alters results
+    evict_fraction = 0.1        # Of < max_rows >, removed when the table is full
+    touch_batch = 1000          # Hit keys gathered before their use times are written
+
+    def __init__( self, path, max_rows=200000 ):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._lock = threading.Lock()     # For the counts and < _touched >; threads share them
+        self._puts = 0
+        self._touched = set()             # Keys hit since their use times were last written
+        self.hits = self.misses = self.evictions = self.errors = 0
+
+    def _connection( self ):
+        # One connection per thread, and a fresh one after a fork.
+        local = self._local
+        if getattr( local, 'pid', None ) != os.getpid():
+            directory = os.path.dirname( self.path )
+            if not os.path.isdir( directory ):
+                try:
+                    os.makedirs( directory )
+                except OSError:
+                    pass
+            local.connection = sqlite3.connect( self.path, timeout=10 )
+            local.connection.execute( 'PRAGMA journal_mode=WAL' )
+            local.connection.execute( 'CREATE TABLE IF NOT EXISTS fits ( key TEXT PRIMARY KEY, '
+                                      'p0 REAL, p1 REAL, ok INTEGER, atime REAL )' )
+            local.connection.execute( 'CREATE INDEX IF NOT EXISTS fits_atime ON fits ( atime )' )
+            local.pid = os.getpid()
+        return local.connection
+
+    def key( self, kind, days, values, *parms ):
+        h = md5.new( '%s|%d|%r|' % ( kind, self.version, parms ) )
+        # < days > may be datetime64 or, as in a DaySeries, int day numbers.
+        h.update( np.ascontiguousarray( np.asarray( days ).astype( 'datetime64[D]' ) ).tobytes() )
+        h.update( np.ascontiguousarray( values, dtype=np.float64 ).tobytes() )
+        return h.hexdigest()
+
+    def get_many( self, keys ):
+        # Returns { key: ( p0, p1, ok ) } for the keys found.
+        found = {}
+        try:
+            connection = self._connection()
+            for i in range( 0, len( keys ), 500 ):          # SQLite caps bound variables
+                chunk = keys[ i:i+500 ]
+                marks = ','.join( '?' * len( chunk ) )
+                for key, p0, p1, ok in connection.execute( 
+                        'SELECT key, p0, p1, ok FROM fits WHERE key IN (%s)' % marks, chunk ):
+                    found[ key ] = ( p0, p1, bool( ok ) )
+        except sqlite3.Error:
+            self._count( errors=1 )
+        with self._lock:
+            self.hits += len( found )
+            self.misses += len( keys ) - len( found )
+            self._touched.update( found )
+            due = len( self._touched ) >= self.touch_batch
+        if due:
+            try:
+                with self._connection() as connection:
+                    self._touch( connection )
+            except sqlite3.Error:
+                self._count( errors=1 )
+        return found
+
+    def _count( self, **counts ):
+        with self._lock:
+            for name, n in counts.items():
+                setattr( self, name, getattr( self, name ) + n )
+
+    def _touch( self, connection ):
+        # Writes the use time of the keys hit since last time, in the caller's transaction.
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        if touched:
+            now = time.time()
+            connection.executemany( 'UPDATE fits SET atime=? WHERE key=?', [ ( now, key ) for key in touched ] )
+
+    def put_many( self, items ):
+        # < items > is a list of ( key, p0, p1, ok ).
+        if not items:
+            return
+        try:
+            connection = self._connection()
+            now = time.time()
+            with connection:
+                connection.executemany( 'INSERT OR REPLACE INTO fits VALUES (?,?,?,?,?)',
+                    [ ( key, float( p0 ), float( p1 ), int( ok ), now ) for key, p0, p1, ok in items ] )
+                self._touch( connection )
+            with self._lock:
+                self._puts += len( items )
+                due = self._puts * 20 >= self.max_rows      # Count rows now and then only
+                if due:
+                    self._puts = 0
+            if due:
+                self.evict( connection )
+        except sqlite3.Error:
+            self._count( errors=1 )
+
+    def evict( self, connection ):
+        n_rows = connection.execute( 'SELECT COUNT(*) FROM fits' ).fetchone()[0]
+        if n_rows > self.max_rows:
+            n_evict = n_rows - self.max_rows + int( self.max_rows * self.evict_fraction )
+            with connection:
+                connection.execute( 'DELETE FROM fits WHERE key IN '
+                                    '( SELECT key FROM fits ORDER BY atime LIMIT ? )', ( n_evict, ) )
+            self._count( evictions=n_evict )
+
+    def hit_rate( self ):
+        lookups = self.hits + self.misses
+        return float( self.hits ) / lookups if lookups else 0.
+
+    def __str__( self ):
+        return '%d hits, %d misses (%.0f%% hit rate), %d evictions, %d errors' % ( 
+               self.hits, self.misses, 100 * self.hit_rate(), self.evictions, self.errors )
+
+FITS = FitCache( FIT_CACHE_PATH )
+
 def extrapolate_linear( series, days_back, days_forward ):
-    base_index = series.index[-days_back-1]
-    base_daynum = stamp2daynum( base_index )
-    dd_actual = [ stamp2daynum(x) - base_daynum for x in series.index[-days_back-1:] ]
-    yy_actual = list( series.iloc[-days_back-1:] )
+    # < series > is a DaySeries.  Returns the extrapolated DaySeries and the slope.
+    window = series[ -days_back-1: ]
+    dd_actual = window.days - window.days[0]
+    yy_actual = window.values
+    # Not cached in < FITS >: a cache lookup costs more than this fit.
     m_linear, b_linear = np.polyfit( dd_actual, yy_actual, 1 )
     #print 77477, dd_actual, yy_actual, b_linear, m_linear
-    dd = dd_actual + range( dd_actual[-1]+1, dd_actual[-1]+1+days_forward )
-    yy = [ m_linear*d + b_linear for d in dd ]
-    #print 482043, dd
-    xx = [ daynum2stamp(d+base_daynum) for d in dd ]
-    return pandas.Series( yy, index=xx ), m_linear
+    dd = np.concatenate([ dd_actual, np.arange( dd_actual[-1]+1, dd_actual[-1]+1+days_forward ) ])
+    return DaySeries( window.days[0] + dd, m_linear*dd + b_linear ), m_linear
 
-def extrapolate_log( series, back, forward ):
-    base_index = series.index[-back-1]
-    base_daynum = stamp2daynum( base_index )
-    dd_actual = [ stamp2daynum(x) - base_daynum for x in series.index[-back-1:] ]
-    yy_actual = [ y                 for y in series.iloc[ -back-1:] ]
+def sliding_loglinear( tt, yy, window_sz ):
+    """
+    Slopes of the least-squares lines through  log( y + shift )  for every run of 
+    < window_sz > consecutive entries of the 1-D arrays < tt > and < yy >.  Each window
+    has its own < shift >, 1 - min( y ) of the window if that is positive, else 0, as in
+    < extrapolation_from_fit >.  Where a window's values are all positive the shift is 0,
+    and the sums its line needs are running sums, updated as the window slides one entry,
+    so those windows together cost O(n); windows holding a value <= 0 are fitted one by
+    one, as < _loglinear_slopes > fits them.  NaN values are left out.  Entry k is the
+    slope of the window ending at entry k; it is NaN before the first full window, and 
+    where a window has fewer than two values.
+    """
+    tt = np.asarray( tt, dtype=np.float64 )
+    yy = np.asarray( yy, dtype=np.float64 )
+    slopes = np.full( len( yy ), np.nan )
+    valid = ~np.isnan( yy )
+    if len( yy ) < window_sz or not valid.any():
+        return slopes
+    positive = valid & ( np.where( valid, yy, 0. ) > 0 )
+    t = np.where( valid, tt - tt[0], 0. )
+    l = np.where( positive, np.log( np.where( positive, yy, 1. ) ), 0. )
+    def running( x ):
+        c = np.concatenate([ [0.], np.cumsum( x ) ])
+        return c[ window_sz: ] - c[ :-window_sz ]
+    n, st, sl = running( valid ), running( t ), running( l )
+    stt, stl = running( t*t ), running( t*l )
+    with np.errstate( invalid='ignore', divide='ignore' ):
+        slopes[ window_sz-1: ] = np.where( n >= 2, ( n*stl - st*sl ) / ( n*stt - st*st ), np.nan )
+        starts = np.flatnonzero( running( valid & ~positive ) > 0 )
+        if len( starts ):
+            rows = starts[ :, None ] + np.arange( window_sz )
+            slopes[ starts + window_sz-1 ] = np.where( n[ starts ] >= 2, 
+                _loglinear_slopes( t[ rows ], np.where( valid, yy, 0. )[ rows ], valid[ rows ] ), np.nan )
+    return slopes
+
+def fit_exponentials( tt, yy, b_start=None, max_iter=100, b_max=2., ftol=1.49012e-08, xtol=1.49012e-08 ):
+    """
+    Least-squares fits of  y = a * exp( b * t )  to many windows at once, with a batched 
+    Levenberg-Marquardt iteration: every step solves all the 2x2 normal equations in 
+    vectorized numpy.  Row i of the 2-D arrays < tt > and < yy > holds window i; NaN in
+    < yy > marks a missing value, so windows of different lengths pad with NaN.
+    < b_start > optionally gives each window's log-linear slope, e.g. from 
+    < sliding_loglinear >; where it is NaN or absent the slope is computed here.
+    The rate < b > is kept within +/- < b_max > (2 = growth by 7.4x a day; the plots 
+    show at most 40% a day).  A fit driven to the bound fails at once, as does one not 
+    converged within < max_iter > iterations.  Returns arrays < a >, < b > and < ok >; 
+    < ok > is False where no fit converged or where a window has fewer than two values.
+    """
+    tt = np.asarray( tt, dtype=np.float64 )
+    yy = np.asarray( yy, dtype=np.float64 )
+    mask = ~np.isnan( yy )
+    tt = np.where( mask, tt, 0. )
+    yy = np.where( mask, yy, 0. )
+    n_valid = mask.sum( axis=1 )
+    n_windows = len( yy )
+
+    # Noisy data, or data that changes sign, can have several local minima.  Fit from 
+    # three starts and keep the best fit: the log-linear fit of the shifted values, as 
+    # < extrapolate_log > always computed; the flat fit b = 0; and a = b = 1, where 
+    # curve_fit started.
+    with np.errstate( over='ignore', invalid='ignore', divide='ignore' ):
+        n = np.maximum( n_valid, 1 )
+        b0 = np.full( n_windows, np.nan ) if b_start is None else np.asarray( b_start, dtype=np.float64 )
+        todo = np.isnan( b0 )
+        if todo.any():
+            b0[ todo ] = _loglinear_slopes( tt[ todo ], yy[ todo ], mask[ todo ] )
+        b0 = np.clip( np.where( np.isfinite( b0 ), b0, 0. ), -b_max, b_max )
+        e = np.where( mask, np.exp( b0[ :, None ] * tt ), 0. )
+        a0 = ( e * yy ).sum( axis=1 ) / ( e ** 2 ).sum( axis=1 )
+        a0 = np.where( np.isfinite( a0 ), a0, 0. )
+        # All starts run as one batch of 3 x < n_windows > fits.
+        ones = np.ones( n_windows )
+        a_starts = np.concatenate([ a0, yy.sum( axis=1 ) / n, ones ])
+        b_starts = np.concatenate([ b0, np.zeros( n_windows ), ones ])
+        aaa, bbb, costs, oks = _levenberg_marquardt( np.tile( tt, (3,1) ), np.tile( yy, (3,1) ), 
+                                     np.tile( mask, (3,1) ), a_starts, b_starts, max_iter, b_max, ftol, xtol )
+    costs = np.where( oks, costs, np.inf ).reshape( 3, n_windows )
+    best = costs.argmin( axis=0 ) * n_windows + np.arange( n_windows )
+    a, b, ok = aaa[ best ], bbb[ best ], oks.reshape( 3, n_windows ).any( axis=0 )
+    ok &= ( n_valid >= 2 ) & np.isfinite( a ) & ( np.abs( b ) < b_max )
+    return a, b, ok
+
+def _loglinear_slopes( tt, yy, mask ):
+    # Per-window log-linear slopes, for the windows < fit_exponentials > got no start for.
+    n = np.maximum( mask.sum( axis=1 ), 1 )
+    shift = np.where( mask, yy, np.inf ).min( axis=1 )
+    shift = np.where( shift <= 0, 1 - shift, 0. )[ :, None ]
+    logged = np.where( mask, np.log( np.where( mask, yy + shift, 1. ) ), 0. )
+    t_dev = np.where( mask, tt - ( tt.sum( axis=1 ) / n )[ :, None ], 0. )
+    l_dev = np.where( mask, logged - ( logged.sum( axis=1 ) / n )[ :, None ], 0. )
+    return ( t_dev * l_dev ).sum( axis=1 ) / ( t_dev ** 2 ).sum( axis=1 )
+
+def _levenberg_marquardt( tt, yy, mask, a, b, max_iter, b_max, ftol, xtol ):
+    # Batched LM for < fit_exponentials >, damping the full Newton step (the model is 
+    # simple enough for exact second derivatives, which keeps convergence fast on the
+    # large-residual fits that noisy daily counts give).  Each iteration works on the 
+    # windows that have not converged yet.  Returns a, b, cost and ok arrays.
+    a, b = a.copy(), b.copy()
+    lam = np.full( len( a ), 1e-3 )
+    nu = np.full( len( a ), 2. )
+    ok = np.zeros( len( a ), dtype=bool )
+    e = np.where( mask, np.exp( b[ :, None ] * tt ), 0. )
+    r = a[ :, None ] * e - yy
+    cost = ( r ** 2 ).sum( axis=1 )
+    live = np.flatnonzero( np.isfinite( cost ) )
+    t, y, m, e, r = tt[ live ], yy[ live ], mask[ live ], e[ live ], r[ live ]
+    for _ in range( max_iter ):
+        if not len( live ):
+            break
+        al, bl, lm, cl = a[ live ], b[ live ], lam[ live ], cost[ live ]
+        ja, jb = e, al[ :, None ] * t * e
+        g1, g2 = ( ja * r ).sum( axis=1 ), ( jb * r ).sum( axis=1 )
+        h11, h12, h22 = ( ja * ja ).sum( axis=1 ), ( ja * jb ).sum( axis=1 ), ( jb * jb ).sum( axis=1 )
+        # At a minimum the Gauss-Newton step predicts almost no decrease.
+        at_min = ~( ( g1*g1*h22 - 2*g1*g2*h12 + g2*g2*h11 ) / ( h11*h22 - h12*h12 ) > ftol * cl )
+        f12 = h12 + ( r * t * e ).sum( axis=1 )
+        f22 = h22 + ( r * al[ :, None ] * t * t * e ).sum( axis=1 )
+        d11, d22 = h11 + lm * h11, f22 + lm * h22
+        det = d11 * d22 - f12 * f12
+        da = ( -g1 * d22 + g2 * f12 ) / det
+        db = ( -g2 * d11 + g1 * f12 ) / det
+        db = np.clip( bl + db, -b_max, b_max ) - bl         # Projected onto the bounds
+        predicted = -( 2 * ( g1*da + g2*db ) + h11*da*da + 2*f12*da*db + f22*db*db )
+        a_new, b_new = al + da, bl + db
+        e_new = np.where( m, np.exp( b_new[ :, None ] * t ), 0. )
+        r_new = a_new[ :, None ] * e_new - y
+        cost_new = ( r_new ** 2 ).sum( axis=1 )
+        rho = ( cl - cost_new ) / predicted
+        better = ( cost_new <= cl ) & ( predicted > 0 ) & ~at_min
+        small_step = better & ( np.abs( da ) <= xtol * ( np.abs( al ) + xtol ) ) & \
+                              ( np.abs( db ) <= xtol * ( np.abs( bl ) + xtol ) )
+        converged = at_min | small_step
+        a[ live ] = np.where( better, a_new, al )
+        b[ live ] = np.where( better, b_new, bl )
+        cost[ live ] = np.where( better, cost_new, cl )
+        # Nielsen's damping update.
+        shrink = np.maximum( 1/3., 1 - ( 2*np.where( better, rho, 0 ) - 1 ) ** 3 )
+        lam[ live ] = np.where( better, lm * shrink, lm * nu[ live ] )
+        nu[ live ] = np.where( better, 2., nu[ live ] * 2 )
+        e = np.where( better[ :, None ], e_new, e )
+        r = np.where( better[ :, None ], r_new, r )
+        # A step that cannot lower the cost even when tiny means a minimum.
+        stuck = ~better & ( lam[ live ] > 1e12 )
+        # A fit driven to the bound has no meaningful rate: give up on it now.
+        pinned = better & ( np.abs( b_new ) >= b_max )
+        ok[ live ] = ( converged | stuck ) & ~pinned
+        going = ~( converged | stuck | pinned ) & np.isfinite( lam[ live ] )
+        live = live[ going ]
+        t, y, m, e, r = t[ going ], y[ going ], m[ going ], e[ going ], r[ going ]
+    return a, b, cost, ok
+
+def extrapolation_from_fit( days, yy, a, b, forward ):
     # The nan checking is a band-aid because NYT Mariposa has a NaN.  Why wasn't it dropped?
-    both = filter( lambda dy: not math.isnan(dy[1]), zip( dd_actual, yy_actual ) )
-    dd_actual = [ d for d,y in both ]
-    yy_actual = [ y for d,y in both ]
-    #print 'yy_actual', yy_actual
-    const = min(yy_actual)
+    valid = ~np.isnan( yy )
+    dd_actual = days[ valid ] - days[0]
+    const = yy[ valid ].min()
     const = -(const-1) if const<=0 else 0
-    #print 22293, min(yy_actual), const, [(y+const) for y in yy_actual ]
-    yy_logged = [ math.log(y+const) for y in yy_actual ]
-    m_linear, b_linear = np.polyfit( dd_actual, yy_logged, 1 )
-    #print 774248, dd_actual, yy_actual, b_linear, m_linear
-    p_opt, p_cov = scipy.optimize.curve_fit(lambda t,a,b: a*np.exp(b*t), dd_actual, yy_actual,  p0=None ) #[2.7**m_linear,b_linear] )
-    dd = dd_actual + range( dd_actual[-1]+1, dd_actual[-1]+1+forward )
-    yy = [ p_opt[0]*math.exp(p_opt[1]*d)-const for d in dd ]
-    xx = [ daynum2stamp(d+base_daynum)         for d in dd ]
-    #print 774299, dd, yy, math.log(2)/p_opt[1]
-    return pandas.Series( yy, index=xx ), math.log(2)/p_opt[1], math.log(0.5)/p_opt[1]  # .rename_axis('extrapolated')
-
-class SerGeo:
-    def __init__( self, geo_name, df, series_name, left_time ):
-        self.series_name = series_name
-        self.geo_name = geo_name
+    dd = np.concatenate([ dd_actual, np.arange( dd_actual[-1]+1, dd_actual[-1]+1+forward ) ])
+    yy = a*np.exp(b*dd)-const
+    # A flat fit (b = 0) never doubles or halves.
+    doubling, halving = ( math.log(2)/b, math.log(0.5)/b ) if b else ( float('inf'), float('inf') )
+    return DaySeries( days[0] + dd, yy ), doubling, halving
+
+def extrapolate_log_many( series_list, forward, b_starts=None ):
+    # Batched < extrapolate_log > over whole DaySeries: one < fit_exponentials > call for
+    # all the windows not in < FITS >.  Returns ( series, doubling, halving ) per series,
+    # or None where the fit failed.
+    if not series_list:
+        return []
+    if b_starts is None:
+        b_starts = [ np.nan ] * len( series_list )
+    keys = [ FITS.key( 'exponential', series.days, series.values, repr( b_start ) )
+             for series, b_start in zip( series_list, b_starts ) ]
+    fits = FITS.get_many( keys )
+    todo = [ i for i, key in enumerate( keys ) if key not in fits ]
+    if todo:
+        width = max( len( series_list[i] ) for i in todo )
+        tt = np.zeros( ( len( todo ), width ) )
+        yy = np.full( ( len( todo ), width ), np.nan )
+        for row, i in enumerate( todo ):
+            series = series_list[i]
+            tt[ row, :len( series ) ] = series.days - series.days[0]
+            yy[ row, :len( series ) ] = series.values
+        aa, bb, oks = fit_exponentials( tt, yy, [ b_starts[i] for i in todo ] )
+        fitted = [ ( keys[i], a, b, ok ) for i, a, b, ok in zip( todo, aa, bb, oks ) ]
+        FITS.put_many( fitted )
+        fits.update( ( key, ( a, b, ok ) ) for key, a, b, ok in fitted )
+    return [ extrapolation_from_fit( series.days, series.values, fits[key][0], fits[key][1], forward )
+             if fits[key][2] else None
+             for series, key in zip( series_list, keys ) ]
+
+def extrapolate_log( series, back, forward ):
+    # < series > is a DaySeries.
+    extrapolation = extrapolate_log_many( [ series[ -back-1: ] ], forward )[0]
+    if extrapolation is None:
+        raise RuntimeError( 'Exponential fit did not converge.' )     # As curve_fit raises
+    return extrapolation
+
+class DaySeries( object ):
+    """
+    One value per day, as two parallel numpy arrays: < days > holds int day numbers (days
+    since 1970-01-01, the integer form of datetime64[D]) and < values > floats, NaN where
+    missing.  Slicing is positional, like < pandas.Series.iloc >, and gives views, so a
+    window copies nothing.  Holds what a SerGeo used to keep in a pandas Series.
+    """
+    __slots__ = ( 'days', 'values' )
+
+    def __init__( self, days, values ):
+        self.days = days
+        self.values = values
+
+    @classmethod
+    def FromPandas( _, series ):
+        return DaySeries( series.index.values.astype( 'datetime64[D]' ).astype( np.int64 ),
+                          series.values.astype( np.float64 ) )
+
+    def to_pandas( self ):
+        return pandas.Series( self.values, index=pandas.DatetimeIndex( self.stamps() ) )
 
-        series = df[ self.series_name ]
-        #print 8998, self.series_name,'\n',series
+    def stamps( self ):
+        return self.days.astype( 'datetime64[D]' )
+
+    def __len__( self ):
+        return len( self.values )
+
+    def __getitem__( self, span ):
+        return DaySeries( self.days[ span ], self.values[ span ] )
+
+    def diff( self ):
+        values = np.empty_like( self.values )
+        values[:1] = np.nan
+        np.subtract( self.values[1:], self.values[:-1], out=values[1:] )
+        return DaySeries( self.days, values )
+
+    def ewm_mean( self, span ):
+        # Same steps as < pandas.Series.ewm( span=span, adjust=True ).mean() >, so the
+        # results match to the bit (and so do the < FITS > keys made from them).
+        old_wt_factor = 1. - 1. / ( 1. + ( span - 1 ) / 2. )
+        values = np.empty( len( self.values ) )
+        avg, old_wt = np.nan, 1.
+        for i, cur in enumerate( self.values.tolist() ):
+            if avg == avg:
+                old_wt *= old_wt_factor
+                if cur == cur:
+                    if avg != cur:
+                        avg = ( old_wt * avg + cur ) / ( old_wt + 1. )
+                    old_wt += 1.
+            elif cur == cur:
+                avg = cur
+            values[ i ] = avg
+        return DaySeries( self.days, values )
+
+    def valid_values( self ):
+        return self.values[ ~np.isnan( self.values ) ]
+
+    def mean( self ):
+        # Summed as pandas does, NaN taken as 0, so the result matches; NaN if no values.
+        missing = np.isnan( self.values )
+        n = len( missing ) - missing.sum()
+        return np.where( missing, 0., self.values ).sum() / n if n else np.nan
+
+    def max( self ):
+        valid = self.valid_values()
+        return valid.max() if len( valid ) else np.nan
+
+class SerGeo( object ):
+    # Slots, and a DaySeries rather than a pandas Series, because a Geostack makes dozens
+    # of sergeos per geo: every window and extrapolation is one.  < geo_series > still
+    # gives a pandas Series for plotting.
+    __slots__ = ( 'series_name', 'geo_name', 'days_values', 'extrapolation_doubling',
+                  'extrapolation_halving', 'extrapolation_slope', '_pandas' )
+
+    def __init__( self, geo_name, df, series_name, left_time ):
+        series = df[ series_name ]
+        #print 8998, series_name,'\n',series
         if left_time:
             series = series.tail( left_time ) #[ series['DATADATE']>=left_time ]
-        self.geo_series = series
-        
+        self._start( geo_name, series_name, DaySeries.FromPandas( series ) )
+
+    @classmethod
+    def FromDaySeries( klass, geo_name, days_values, series_name, left_time ):
+        new = klass.__new__( klass )
+        if left_time:
+            days_values = days_values[ -left_time: ]
+        new._start( geo_name, series_name, days_values )
+        return new
+
+    def _start( self, geo_name, series_name, days_values ):
+        self.series_name = series_name
+        self.geo_name = geo_name
+        self.days_values = days_values
         self.extrapolation_doubling = None  # Assigned if < extrapolate > exponential
         self.extrapolation_halving  = None  # Assigned if < extrapolate > exponential
         self.extrapolation_slope    = None  # Assigned if < extrapolate > linear
+        self._pandas = None
+
+    def _copy( self, days_values, series_name=None ):
+        # This sergeo, holding < days_values > instead.
+        new = self.__class__.__new__( self.__class__ )
+        for slot in self.__slots__:
+            setattr( new, slot, getattr( self, slot ) )
+        new.days_values = days_values
+        new.series_name = series_name or self.series_name
+        new._pandas = None
+        return new
+
+    @property
+    def geo_series( self ):
+        # As a pandas Series, built on first use.
+        if self._pandas is None:
+            self._pandas = self.days_values.to_pandas()
+        return self._pandas
 
     @property
     def series_name_tex( self ):
@@ -77,7 +486,7 @@ class SerGeo:
         return s
 
     def has_something_to_plot( self ):
-        return len( self.geo_series.dropna() ) > 0
+        return len( self.days_values.valid_values() ) > 0
 
     def graphline( self, ax, plotdict ):
         if self.has_something_to_plot():
@@ -86,10 +495,7 @@ class SerGeo:
             return NilGraphline()
 
     def diff( self ):
-        new = SerGeoCopy( self )
-        new.geo_series = self.geo_series.diff()         # Is a pandas method
-        new.series_name = 'daily_' + self.series_name
-        return new
+        return self._copy( self.days_values.diff(), 'daily_' + self.series_name )
 
     #     def diffnorm( self ):                               # "norm" = normalize
     #         new = SerGeoCopy( self )
@@ -100,47 +506,72 @@ class SerGeo:
     #         return new
 
     def smooth( self, window_width ):
-        #from pandas.stats.moments import ewma
-        new = SerGeoCopy( self )
-        #new.geo_series = ewma( self.geo_series, span=5 )
-        #new.geo_series = self.geo_series.ewm(span=3)
-        new.geo_series = self.geo_series.ewm(span=window_width,adjust=True).mean()
-        new.series_name = 'smooth_' + self.series_name
-        return new
+        return self._copy( self.days_values.ewm_mean( window_width ), 'smooth_' + self.series_name )
 
     def as_denominator( self, numerator ):
-        new = SerGeoCopy( self )
-        new.geo_series = ( numerator.geo_series / self.geo_series.astype(float) ).replace([np.inf, -np.inf], np.nan).dropna()
-        #print 822222, new.geo_series
-        #print 822223, new.geo_series.replace([np.inf, -np.inf], np.nan).dropna()
-        new.series_name = 'quotient_' + self.series_name
-        return new
+        # Days in both, where the quotient is finite.
+        days, i_num, i_den = np.intersect1d( numerator.days_values.days, self.days_values.days,
+                                             assume_unique=True, return_indices=True )
+        with np.errstate( divide='ignore', invalid='ignore' ):
+            quotient = numerator.days_values.values[ i_num ] / self.days_values.values[ i_den ]
+        keep = np.isfinite( quotient )
+        return self._copy( DaySeries( days[ keep ], quotient[ keep ] ), 'quotient_' + self.series_name )
 
     def extrapolate( self, days_back, days_forward, exponential ):
-        new = SerGeoCopy( self )
         if exponential:
             #print 50555, self.series_name, self.geo_name, self.geo_series
-            new.geo_series, new.extrapolation_doubling, new.extrapolation_halving = \
-                              extrapolate_log( self.geo_series, days_back, days_forward )
+            days_values, doubling, halving = extrapolate_log( self.days_values, days_back, days_forward )
+            new = self._copy( days_values )
+            new.extrapolation_doubling, new.extrapolation_halving = doubling, halving
         else:
-            new.geo_series, new.extrapolation_slope = extrapolate_linear( self.geo_series, days_back, days_forward )
+            days_values, slope = extrapolate_linear( self.days_values, days_back, days_forward )
+            new = self._copy( days_values )
+            new.extrapolation_slope = slope
         return new
 
+    def loglinear_trend( self, window_sz ):
+        # Daily growth rate ( slope of log values ) over each run of < window_sz > values,
+        # as a DaySeries by the run's last day: the whole history in one O(n) pass.
+        return DaySeries( self.days_values.days,
+                          sliding_loglinear( self.days_values.days, self.days_values.values, window_sz ) )
+
+    def doubling_history( self, window_sz ):
+        # Doubling time in days, negative when halving, for every day of the series.
+        trend = self.loglinear_trend( window_sz )
+        with np.errstate( divide='ignore' ):
+            doubling = math.log(2) / trend.values
+        doubling[ np.isinf( doubling ) ] = np.nan
+        return DaySeries( trend.days, doubling )
+
+    @classmethod
+    def ExtrapolateMany( _, sergeos, days_forward, b_starts=None ):
+        # Exponential < extrapolate > of each whole sergeo, fitted in one batch.  Returns the
+        # extrapolated copies, with None where a fit failed (where < extrapolate > raises).
+        # < b_starts > optionally gives log-linear slopes to start from; see < fit_exponentials >.
+        extrapolations = extrapolate_log_many( [ sergeo.days_values for sergeo in sergeos ],
+                                               days_forward, b_starts )
+        news = []
+        for sergeo, extrapolation in zip( sergeos, extrapolations ):
+            new = None
+            if extrapolation is not None:
+                days_values, doubling, halving = extrapolation
+                new = sergeo._copy( days_values )
+                new.extrapolation_doubling, new.extrapolation_halving = doubling, halving
+            news.append( new )
+        return news
+
     def subseq( self, a, b ):
-        new = SerGeoCopy( self )
         # Special case for zero because extrapolation likes to use < subseq[-len:0] >.
-        new.geo_series = self.geo_series[a:] if b==0 else self.geo_series[a:b]
-        return new
+        return self._copy( self.days_values[a:] if b==0 else self.days_values[a:b] )
 
     def datalength( self ):
-        return len( self.geo_series )
+        return len( self.days_values )
 
     def maxval( self ):
-        return self.geo_series.max()
+        return self.days_values.max()
 
-class SerGeoCopy( SerGeo ):
-    def __init__( self, original_geoseries ):
-        self.__dict__ = copy.copy( original_geoseries.__dict__ )
+    def meanval( self ):
+        return self.days_values.mean()
 
 class Graphline:
     def __init__( self, ax, geo_series_obj, series_name, pandas_series, plotdict={} ):
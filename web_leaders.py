@@ -0,0 +1,121 @@
+"""
+Leaderboard of current growth rates.  For every geo of every series it holds the raw and
+smoothed percent-per-day change of the most recent Geostack layer -- the two marks on
+the top row of a plot -- so that e.g. the fastest-growing US counties can be listed
+without drawing anything.  Built in one batch after each ingest (see < flask_main -g >),
+stored as vDATA1/leaderboard.csv, and served by the /leaders endpoint.
+"""
+
+import os, time, math
+
+import numpy as np
+import pandas as pd
+
+import web_grab
+import web_graphline
+import web_stacker
+
+LEADERBOARD_FILENAME = 'leaderboard.csv'
+LEVELS = ( 'nation', 'state', 'county' )
+GEO_FIELDS = ( 'nation', 'state', 'county' )
+NUMBER_FIELDS = ( 'daily', 'pct_raw', 'pct_smooth', 'doubling_days' )
+FIELDS = ( 'series', 'level' ) + GEO_FIELDS + ( 'date', ) + NUMBER_FIELDS
+
+def leaderboard_path():
+    return os.path.join( web_grab.DiskFile0.dirpath1, LEADERBOARD_FILENAME )
+
+def build_leaderboard( left_time, back_days=14, smooth_days=7, force=False ):
+    # Skips the work when the stored leaderboard is newer than the last snapshot swap.
+    # Returns the number of rows stored.
+    path = leaderboard_path()
+    generation_path = web_grab.Snapshots.generation_path()
+    if (not force) and os.path.isfile( path ) and os.path.isfile( generation_path ) \
+                   and os.path.getmtime( path ) >= os.path.getmtime( generation_path ):
+        print 'Leaderboard is current'
+        return None
+    t0 = time.time()
+    rows = []
+    for series in web_grab.Series.AlphaList():
+        rows.extend( series_rows( series, left_time, back_days, smooth_days ) )
+    df = pd.DataFrame( rows, columns=FIELDS )
+    with open( path + '.tmp', 'w' ) as f:
+        df.to_csv( f, index=False, encoding='utf-8' )
+    os.rename( path + '.tmp', path )                    # Atomic on Unix
+    print 'Finished leaderboard: %d geos in %.2f sec' % ( len( df ), time.time()-t0 )
+    return len( df )
+
+def series_rows( series, left_time, back_days, smooth_days ):
+    # One row per geo of < series >, from its geo-by-day matrix, with all fits in one batch.
+    # Each geo gets the SerGeo that < flask_main.build_image > would plot for it: its days
+    # with a value, since the matrix has NaN on the days of other geos.
+    matrix = series.matrix()
+    if matrix is None:
+        return []
+    days = matrix.dates.values.astype( 'datetime64[D]' ).astype( np.int64 )
+    geos, sergeo_tuples = [], []
+    for geo, values in zip( matrix.geos, matrix.values ):
+        valid = ~np.isnan( values )
+        if valid.sum() < 3:
+            continue
+        sergeo = web_graphline.SerGeo.FromDaySeries( filter( None, geo )[-1],
+                                                     web_graphline.DaySeries( days[ valid ], values[ valid ] ),
+                                                     series.name_internal, left_time ).diff()
+        geos.append( geo )
+        sergeo_tuples.append( ( sergeo, sergeo.smooth( smooth_days ) ) )
+    rows = []
+    for geo, ( sergeo, _ ), ( _, layer_windows ) in zip(
+                geos, sergeo_tuples, web_stacker.fit_layers( sergeo_tuples, back_days, 1 ) ):
+        ( raw_window, raw_fit ), ( smooth_window, smooth_fit ) = layer_windows[0]
+        pct_raw = web_stacker.PointRaw( raw_window, raw_fit ).pct
+        pct_smooth = web_stacker.PointSmooth( smooth_window, smooth_fit ).pct
+        # Geos that are flat or shrinking have no doubling time, so they sort last.
+        doubling = web_stacker.LN2x100 / pct_smooth if pct_smooth > 0 else None
+        rows.append( ( series.name_internal, LEVELS[ len( filter( None, geo ) )-1 ] ) + tuple( geo ) +
+                     ( str( sergeo.days_values.stamps()[-1] ), sergeo.days_values.values[-1],
+                       pct_raw, pct_smooth, doubling ) )
+    return rows
+
+class Leaderboard:
+    # The stored leaderboard as a DataFrame, reloaded when a newer one has been written.
+    def __init__( self ):
+        self._df = None
+        self._stamp = None
+
+    def frame( self ):
+        # Returns None if no leaderboard has been built yet.
+        try:
+            st = os.stat( leaderboard_path() )
+        except OSError:
+            return None
+        stamp = ( st.st_ino, st.st_mtime, st.st_size )
+        if stamp != self._stamp:
+            df = pd.read_csv( leaderboard_path(), encoding='utf-8',
+                              dtype={ field: object for field in GEO_FIELDS } )
+            for field in GEO_FIELDS:
+                df[ field ] = df[ field ].fillna( web_grab.EMPTY )
+            self._df, self._stamp = df, stamp
+        return self._df
+
+    def query( self, series=None, level=None, nation=None, state=None, min_daily=None,
+               sort='pct_smooth', ascending=False, n=50 ):
+        # Top < n > rows by < sort >, after filtering; rows with no value sort last.
+        # Returns a list of dicts, with None for missing values.
+        df = self.frame()
+        if df is None:
+            return []
+        if sort not in NUMBER_FIELDS:
+            raise ValueError( 'Cannot sort by %s' % sort )
+        if n < 1:
+            raise ValueError( 'Cannot list %d rows' % n )
+        keep = np.ones( len( df ), dtype=bool )
+        for field, value in ( ('series',series), ('level',level), ('nation',nation), ('state',state) ):
+            if value is not None:
+                keep &= ( df[ field ] == value ).values
+        if min_daily is not None:
+            keep &= ( df[ 'daily' ] >= min_daily ).values
+        df = df[ keep ].sort_values( sort, ascending=ascending, na_position='last' ).head( n )
+        return [ { field: ( None if ( isinstance( value, float ) and math.isnan( value ) ) else value )
+                   for field, value in zip( FIELDS, row ) }
+                 for row in df[ list( FIELDS ) ].itertuples( index=False ) ]
+
+LEADERS = Leaderboard()
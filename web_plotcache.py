@@ -0,0 +1,194 @@
+"""
+Rendered plot images on disk, kept within bounds.  Each image lives at
+static/<series_version>/<xx>/<md5>.png, where <xx> is the first two hex digits of the md5,
+so that no one directory grows past a few thousand files.  An image never changes once
+written, so its mtime is free to record when it was last asked for (see < lookup >), and
+eviction goes by that.  < collect > removes, in this order: the version directories that
+no series uses any more, once unused for a grace period; leftovers of renders that died
+(.tmp files, and .lock files no one holds); and then the least recently used images,
+until the rest fit the byte and file budgets.
+"""
+
+import os, re, time, shutil, fcntl, threading
+
+import web_grab
+
+VERSION_PATTERN = re.compile( r'^[0-9]{6}\.[0-9]{6}$' )  # As < Series.timedname( compact=True ) >
+
+def current_versions():
+    # The version directory of each series that has data.
+    versions = set()
+    for series in web_grab.Series.AlphaList():
+        version = series.timedname( compact=True )
+        if version is not None:     # Else not polled yet
+            versions.add( version )
+    return versions
+
+class PlotCache:
+    max_bytes = 2 * 1024**3
+    max_files = 100000
+    low_water = 0.9             # Eviction goes down to this fraction of each budget
+    min_age = 600               # Seconds an image is kept after last asked for, budget or not
+    grace = 24 * 3600           # Seconds a superseded version outlives its last use
+    stale = 3600                # Seconds after which a .tmp or unheld .lock file is debris
+    collect_seconds = 600       # Least time between collections started by < lookup >
+    shard_digits = 2
+
+    def __init__( self, dirpath, href0 ):
+        self.dirpath = dirpath
+        self.href0 = href0
+        self.hits = self.misses = 0
+        self.last_collection = None     # Report of the last < collect >
+        self._collected = 0.
+        self._collecting = False
+        self._lock = threading.Lock()
+
+    def paths( self, series_version, digest ):
+        # The image's pathname and href.
+        shard = digest[ :self.shard_digits ]
+        filename = digest + '.png'
+        return ( os.path.join( self.dirpath, series_version, shard, filename ),
+                 os.path.join( self.href0, series_version, shard, filename ) )
+
+    def lookup( self, pathname ):
+        # True if the image is on disk, in which case it is marked as used now.  Counts a
+        # hit or a miss, and starts a collection in the background when one is due.
+        try:
+            os.utime( pathname, None )
+            hit = True
+        except OSError:
+            hit = False
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            due = (not self._collecting) and time.time() - self._collected >= self.collect_seconds
+            if due:
+                self._collecting = True
+        if due:
+            thread = threading.Thread( target=self._collect_in_background )
+            thread.daemon = True
+            thread.start()
+        return hit
+
+    def _collect_in_background( self ):
+        try:
+            self.collect()
+        except Exception as e:
+            print 'Plot cache collection failed:', repr( e )
+        finally:
+            with self._lock:
+                self._collecting = False
+                self._collected = time.time()
+
+    def collect( self, versions=None ):
+        # < versions > are those still in use; by default, those of the current snapshot.
+        # Returns the same report as < report >.
+        t0 = now = time.time()
+        versions = current_versions() if versions is None else versions
+        images = []                 # ( mtime, size, pathname )
+        n_versions = removed_versions = removed_debris = 0
+        try:
+            version_names = os.listdir( self.dirpath )
+        except OSError:
+            version_names = []          # No image drawn yet
+        for version in version_names:
+            version_path = os.path.join( self.dirpath, version )
+            if not ( VERSION_PATTERN.match( version ) and os.path.isdir( version_path ) ):
+                continue
+            files = list( self._files( version_path ) )
+            try:
+                last_used = max([ os.path.getmtime( version_path ) ] + [ st.st_mtime for _, st in files ])
+            except OSError:
+                continue                # Removed meanwhile, e.g. by another process's collection
+            if version not in versions and last_used < now - self.grace:
+                shutil.rmtree( version_path, ignore_errors=True )
+                removed_versions += 1
+                continue
+            n_versions += 1
+            for pathname, st in files:
+                if pathname.endswith( '.png' ):
+                    images.append( ( st.st_mtime, st.st_size, pathname ) )
+                elif st.st_mtime < now - self.stale:
+                    if pathname.endswith( '.tmp' ):
+                        removed_debris += self._remove( pathname )
+                    elif pathname.endswith( '.lock' ):
+                        removed_debris += self._remove_lock( pathname )
+        n_files, n_bytes, evicted = self._evict( sorted( images ), now )
+        with self._lock:
+            self.last_collection = { 'versions': n_versions, 'files': n_files, 'bytes': n_bytes,
+                                     'evicted': evicted, 'removed_versions': removed_versions,
+                                     'removed_debris': removed_debris, 'time': now }
+        print 'Plot cache: %d images, %.1f MB in %d versions; evicted %d, removed %d versions ' \
+              'and %d leftovers in %.2f sec' % ( n_files, n_bytes / 1e6, n_versions, evicted,
+                                                removed_versions, removed_debris, time.time()-t0 )
+        return self.report()
+
+    def _files( self, dirpath ):
+        # ( pathname, stat ) of every file under < dirpath >.
+        for root, _, filenames in os.walk( dirpath ):
+            for filename in filenames:
+                pathname = os.path.join( root, filename )
+                try:
+                    yield pathname, os.stat( pathname )
+                except OSError:
+                    pass                # Renamed or removed meanwhile
+
+    def _evict( self, images, now ):
+        # < images > are oldest first.  Returns files and bytes left, and files evicted.
+        n_files = len( images )
+        n_bytes = sum( size for _, size, _ in images )
+        evicted = 0
+        if n_files > self.max_files or n_bytes > self.max_bytes:
+            for mtime, size, pathname in images:
+                if n_files <= self.low_water * self.max_files and n_bytes <= self.low_water * self.max_bytes:
+                    break
+                if mtime >= now - self.min_age:
+                    break               # This and all after were asked for just now
+                if self._remove( pathname ):
+                    n_files -= 1
+                    n_bytes -= size
+                    evicted += 1
+        return n_files, n_bytes, evicted
+
+    def _remove( self, pathname ):
+        try:
+            os.remove( pathname )
+            return 1
+        except OSError:
+            return 0
+
+    def _remove_lock( self, lock_path ):
+        # Only if no render holds it, and then under the lock and before unlocking, as
+        # < flask_main.render_once > does, so that anyone queued on it queues anew.
+        try:
+            lock_file = open( lock_path, 'a' )
+        except IOError:
+            return 0
+        try:
+            fcntl.flock( lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB )
+        except IOError:
+            lock_file.close()
+            return 0
+        try:
+            if os.fstat( lock_file.fileno() ).st_ino == os.stat( lock_path ).st_ino:
+                os.remove( lock_path )
+                return 1
+            return 0
+        except OSError:
+            return 0
+        finally:
+            fcntl.flock( lock_file, fcntl.LOCK_UN )
+            lock_file.close()
+
+    def report( self ):
+        # Hits and misses of this process's lookups, with the sizes found by the last
+        # collection, if any.
+        with self._lock:
+            lookups = self.hits + self.misses
+            answer = { 'hits': self.hits, 'misses': self.misses,
+                       'hit_rate': float( self.hits ) / lookups if lookups else 0.,
+                       'max_bytes': self.max_bytes, 'max_files': self.max_files }
+            answer.update( self.last_collection or {} )
+        return answer
@@ -0,0 +1,108 @@
+"""
+How often each plot is asked for, kept so that the most popular plots can be drawn ahead
+of their first visitor whenever a new snapshot makes the cached images stale (see
+< flask_main.Prewarmer >).  A plot is counted by an opaque key, the places string
+of < flask_main.encode_places > without a pathname.  Counts are kept in memory and
+written now and then to one small SQLite file beside the fit cache, shared by every
+process: one row per distinct plot, holding its count and when it was last asked for.
+"""
+
+import os, time, sqlite3, threading, collections
+
+# Same directory as < web_graphline.FIT_CACHE_PATH >.
+POPULAR_PATH = os.path.join( os.path.abspath( os.path.join( os.path.abspath( __file__ ), '../..' ) ),
+                             'vCACHE', 'popular.sqlite' )
+
+class PlotCounter:
+    """
+    Request counts per plot key.  < record > only adds to a Counter in memory; the counts
+    reach disk in one transaction every < flush_every > requests, and at most 
+    < flush_seconds > after they were recorded, by a timer if no request comes, so a page
+    view costs no disk write.  At most < max_rows > plots are kept, the longest
+    unasked-for first out.  As with < FitCache >, a SQLite error costs only the counts.
+    """
+    flush_every = 20
+    flush_seconds = 60
+    evict_fraction = 0.1
+
+    def __init__( self, path, max_rows=100000 ):
+        self.path = path
+        self.max_rows = max_rows
+        self._pending = collections.Counter()
+        self._lock = threading.Lock()
+        self._flushed = time.time()
+        self._timer = None
+        self._local = threading.local()
+        self.errors = 0
+
+    def _connection( self ):
+        # One connection per thread, and a fresh one after a fork.
+        local = self._local
+        if getattr( local, 'pid', None ) != os.getpid():
+            directory = os.path.dirname( self.path )
+            if not os.path.isdir( directory ):
+                try:
+                    os.makedirs( directory )
+                except OSError:
+                    pass
+            local.connection = sqlite3.connect( self.path, timeout=10 )
+            local.connection.execute( 'PRAGMA journal_mode=WAL' )
+            local.connection.execute( 'CREATE TABLE IF NOT EXISTS plots ( key TEXT PRIMARY KEY, '
+                                      'hits INTEGER, atime REAL )' )
+            local.pid = os.getpid()
+        return local.connection
+
+    def record( self, key ):
+        with self._lock:
+            self._pending[ key ] += 1
+            due = sum( self._pending.values() ) >= self.flush_every or \
+                  time.time() - self._flushed >= self.flush_seconds
+            if not due and self._timer is None:
+                self._timer = threading.Timer( self.flush_seconds, self.flush )
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def flush( self ):
+        with self._lock:
+            pending, self._pending = self._pending, collections.Counter()
+            self._flushed = time.time()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            connection = self._connection()
+            now = time.time()
+            with connection:
+                connection.executemany( 'INSERT OR IGNORE INTO plots VALUES (?,0,?)',
+                                        [ ( key, now ) for key in pending ] )
+                connection.executemany( 'UPDATE plots SET hits=hits+?, atime=? WHERE key=?',
+                                        [ ( hits, now, key ) for key, hits in pending.items() ] )
+            self.evict( connection )
+        except sqlite3.Error:
+            self.errors += 1
+
+    def evict( self, connection ):
+        n_rows = connection.execute( 'SELECT COUNT(*) FROM plots' ).fetchone()[0]
+        if n_rows > self.max_rows:
+            n_evict = n_rows - self.max_rows + int( self.max_rows * self.evict_fraction )
+            with connection:
+                connection.execute( 'DELETE FROM plots WHERE key IN '
+                                    '( SELECT key FROM plots ORDER BY atime LIMIT ? )', ( n_evict, ) )
+
+    def top( self, n, days ):
+        # The < n > most-asked-for keys among those asked for in the last < days >, most
+        # first, as a list of ( key, hits ).  Includes this process's unwritten counts.
+        self.flush()
+        try:
+            return self._connection().execute( 'SELECT key, hits FROM plots WHERE atime >= ? '
+                                               'ORDER BY hits DESC, atime DESC LIMIT ?',
+                                               ( time.time() - days * 86400, n ) ).fetchall()
+        except sqlite3.Error:
+            self.errors += 1
+            return []
+
+POPULAR = PlotCounter( POPULAR_PATH )
@@ -1,9 +1,11 @@
 import math
+import multiprocessing
 
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')                       # Cannot be TkAgg to run in web server
 import matplotlib.pyplot as plt
+import matplotlib.collections
 
 import web_graphline as gl
 import util3
@@ -11,13 +13,77 @@ import util3
 LN2x100 = 100*math.log(2)
 PIXELS_PER_PLOTLINE = 20
 INCHES_PER_PLOTLINE = float(PIXELS_PER_PLOTLINE) / util3.DPI
+BACK_DAYS = 14
+FORWARD_DAYS = 10
+STACK_WORKERS = 1           # Processes that build a plot's Geostacks.  1 = in this process.
+STACK_POOL_MIN_GEOS = 8     # Fewer geos are built in this process; a pool would cost more
 
 def make_geostack( back_days, sergeo ):
+    # A fit that fails leaves only its own point out of the stack (see < Point >).
+    return Geostack( back_days, sergeo, sergeo.smooth( 7 ) )
+
+def map_geos( function, jobs, workers=None ):
+    # < function > of each job, one job per geo, in a pool of < workers > processes if
+    # there are enough jobs to pay for it.  Results come back in order, so plots come out
+    # the same either way.  < function > must be module-level, jobs and results picklable.
+    workers = STACK_WORKERS if workers is None else workers
+    # Daemonic processes cannot start a pool.  Render workers are not daemonic (see 
+    # < flask_main.render_worker >), so this serves plots drawn for the web server as well.
+    if workers <= 1 or len( jobs ) < STACK_POOL_MIN_GEOS or multiprocessing.current_process().daemon:
+        return map( function, jobs )
+    pool = multiprocessing.Pool( min( workers, len( jobs ) ) )
     try:
-        stack = Geostack( back_days, sergeo, sergeo.smooth( 7 ) )
-    except RuntimeError:
-        stack = Geostack( back_days, sergeo )
-    return stack
+        return pool.map( function, jobs )
+    finally:
+        pool.close()
+        pool.join()
+
+def _geostack_job( job ):
+    back_days, sergeo = job
+    return make_geostack( back_days, sergeo.diff() )
+
+def fit_layers( sergeo_tuples, window_sz, n_windows ):
+    """
+    Windows and exponential extrapolations for the layers of many Geostacks, with all
+    the fits in one batch.  Returns, for each sergeo tuple, ( trends, layer_windows ):
+    < trends > holds the < loglinear_trend > of each sergeo, and < layer_windows > holds
+    < n_windows > lists of ( window, extrapolated ) pairs, most recent day first.
+    < extrapolated > is None where there was nothing to fit.
+    """
+    results, fittable = [], []
+    for sergeo_tuple in sergeo_tuples:
+        # The layers' windows overlap in all but one day, so one sliding pass per sergeo 
+        # gives the log-linear trend of every window -- and of every earlier day too.
+        trends = [ gso.loglinear_trend( window_sz ) for gso in sergeo_tuple ]
+        layer_windows = []
+        for i in range( window_sz, window_sz + n_windows ):
+            windows = [ gso.subseq(-i, -i+window_sz ) for gso in sergeo_tuple ]
+            # Window ends at position len - i + window_sz; NaN = partial window, fitted alone.
+            starts = [ trend.values[ len(trend)-i+window_sz-1 ] if i <= len(trend) else np.nan
+                       for trend in trends ]
+            fittable.extend( ( w, b ) for w, b in zip( windows, starts ) 
+                             if w.datalength() > 2 )  # Otherwise fitting a 2-parm model breaks
+            layer_windows.append( windows )
+        results.append( ( trends, layer_windows ) )
+    extrapolated = dict( zip( [ id( w ) for w, _ in fittable ], 
+                              gl.SerGeo.ExtrapolateMany( [ w for w, _ in fittable ], Point.forward_days,
+                                                         [ b for _, b in fittable ] ) ) )
+    return [ ( trends, [ [ ( w, extrapolated.get( id( w ), None ) ) for w in windows ] 
+                         for windows in layer_windows ] )
+             for trends, layer_windows in results ]
+
+def json_number( x ):
+    # None for NaN and infinities, which JSON lacks.
+    return None if x is None or math.isnan( x ) or math.isinf( x ) else float( x )
+
+def series_data( sergeo ):
+    # A sergeo's values, compactly: first day, then each value's day as an offset from it.
+    days_values = sergeo.days_values
+    if not len( days_values ):
+        return { 'start': None, 'days': [], 'values': [] }
+    return { 'start': str( days_values.stamps()[0] ),
+             'days': ( days_values.days - days_values.days[0] ).tolist(),
+             'values': [ None if math.isnan( v ) else round( v, 3 ) for v in days_values.values.tolist() ] }
 
 class Geostack:
     n_windows = 7                       # How many days back we calculate change-rates
@@ -27,39 +93,49 @@ class Geostack:
         self.labeltxt = sergeo1.geo_name
         util3.log( 'Stacker calc for:', self.labeltxt )
 
-        self._layers = [ Layer( [gso.subseq(-i, -i+window_sz ) for gso in self.sergeo_tuple] )
-                         for i in range( window_sz, window_sz + self.n_windows ) ]
+        [ ( self.trends, layer_windows ) ] = fit_layers( [ sergeo_tuple ], window_sz, self.n_windows )
+        self._layers = [ Layer( [ w for w, _ in pairs ], [ x for _, x in pairs ] ) for pairs in layer_windows ]
         # Add 1 line for text label and 1 line for blank line below
         self.n_plotlines = 1 + 1 + len( self._layers )
         self.is_last = False     # Set True elsewhere, maybe
         self.series_nameTex = sergeo1.series_name_tex
-        self.mean_of_raw = sergeo1.geo_series.mean()
+        self.mean_of_raw = sergeo1.meanval()
         
         self.left_ylim = None
         self.solo_ax_position = None
  
+    def as_data( self ):
+        # What < plot_layers > and < waveform > draw, as JSON-ready lists; see < Stacklist.as_data >.
+        # < layers > holds the [ raw, smooth ] pcts of each layer, most recent day first.
+        return { 'label': self.labeltxt,
+                 'mean_of_raw': json_number( self.mean_of_raw ),
+                 'layers': [ [ json_number( point.pct ) for point in layer._points ] for layer in self._layers ],
+                 'series': [ series_data( gso ) for gso in self.sergeo_tuple ],
+                 'extrapolated': [ series_data( point.extrapolated ) if point.extrapolated else None
+                                   for point in self._layers[0]._points ] }
+
     def max_min_pct( self, min0, max0 ):
         for layer in self._layers:
             min0 = min( [ min0, ] + layer.pcts )
             max0 = max( [ max0, ] + layer.pcts )
         return min0, max0
 
-    def plot_layers( self, ax, ytop, ydelta, series_denom ):
+    def plot_layers( self, ax, artists, ytop, ydelta, series_denom ):
+        # Text goes straight onto < ax >; markers, bars and connectors into < artists >.
         x = self._layers[0].midpoint_pct()
         ax.text( x, ytop, self.labeltxt, horizontalalignment='center', va='center' )
         y = ytop - ydelta
         n = float( len( self._layers ) )
         linewidth = max( 0.5, 17.5 * self.mean_of_raw / series_denom )
         linewidth = min( linewidth, 15.5 )
-        connects_x, connects_y = [], []
+        connects = []
         for i, layer in enumerate( self._layers ):
             kolor = ( 0,0,0, 1-i/n )                        # increasing transparency
-            smooth_pct = layer.plot( ax, y, kolor, linewidth )
+            smooth_pct = layer.plot( ax, artists, y, kolor, linewidth )
             if smooth_pct is not None:
-                connects_x.append( smooth_pct )
-                connects_y.append( y )
+                connects.append( ( smooth_pct, y ) )
             y -= ydelta
-        ax.plot( connects_x, connects_y, 'b' )
+        artists.connect( connects )
         return y-ydelta
 
     def waveform( self, ax ):
@@ -114,53 +190,115 @@ class Geostack:
 class Layer:
     zorder=250                  # Frontmost, assuming no higher zorder specified
 
-    def __init__( self, short_series_list ):
-        self._points = [ klass( geo_series ) 
-                         for geo_series, klass in zip( short_series_list, ( PointRaw, PointSmooth ) )  ]
-        self.pcts = filter( None, [ point.pct for point in self._points ] )
+    def __init__( self, short_series_list, extrapolated_list ):
+        self._points = [ klass( geo_series, extrapolated ) 
+                         for geo_series, extrapolated, klass in zip( short_series_list, extrapolated_list, 
+                                                                     ( PointRaw, PointSmooth ) )  ]
+        self.pcts = [ point.pct for point in self._points if point.pct is not None ]   # 0 is flat, not missing
 
     def midpoint_pct( self ):
         return ( min(self.pcts) + max(self.pcts) ) / 2. if self.pcts else 0
 
-    def plot( self, ax, y, kolor, linewidth ):
+    def plot( self, ax, artists, y, kolor, linewidth ):
         if self.pcts:
             max_pct = max( self.pcts )
             min_pct = min( self.pcts )
             for point in self._points:
-                ax.plot( [point.pct,], [y,], point.linestyle, color=kolor, zorder=self.zorder )
+                if point.pct is not None:
+                    artists.marker( point.linestyle, point.pct, y, kolor )
                 ha = 'left' if point.pct == max_pct else ('right' if point.pct==min_pct else None )
                 if ha:
                     ax.text( point.pct, y, '  %.1f%%  ' % point.pct, 
                              horizontalalignment=ha, va='center', color=kolor, zorder=self.zorder )
             if max_pct != min_pct:
-                if linewidth < 3.5:
-                    ax.plot( [min_pct, max_pct], [y,y], color=kolor, zorder=self.zorder,
-                             linewidth = linewidth )
-                else:
-                    y1, y2 = y-linewidth/2., y+linewidth/2.
-                    ax.fill( [min_pct, max_pct, max_pct, min_pct, min_pct ], [y1,y1,y2,y2,y1],
-                             color=kolor, zorder=self.zorder )
+                artists.bar( min_pct, max_pct, y, kolor, linewidth )
         else:
             ax.text( 0, y, '< omitted >', color=kolor, verticalalignment='center', zorder=self.zorder )
         smooth_pcts = [ point.pct for point in self._points 
                         if isinstance(point,PointSmooth) and (point.pct is not None) ]
         return smooth_pcts[0] if len(smooth_pcts)==1 else None
 
+class LayerArtists:
+    """
+    The markers, bars and blue connectors of every Geostack in a plot, gathered while the
+    layers are laid out and then added to the axes by < draw > as a handful of collections:
+    one scatter per marker style, one PolyCollection of thick bars, one LineCollection each
+    of thin bars and of connectors.  Drawn one artist per point, a plot of many geos had
+    thousands of artists, and < savefig > spent most of its time on them.  Stacking order
+    is as before: thick bars, then markers, then thin bars, all under the text.
+    """
+    zorder = Layer.zorder
+    bar_split = 3.5             # Bars this wide or wider are filled, as tall as wide in data units
+
+    def __init__( self ):
+        self.markers = {}                   # linestyle -> ( [ (pct,y) ], [ kolor ] )
+        self.thin_bars = ( [], [], [] )     # segments, kolors, linewidths
+        self.thick_bars = ( [], [] )        # polygons, kolors
+        self.connects = []                  # one polyline per geo
+
+    def marker( self, linestyle, pct, y, kolor ):
+        xys, kolors = self.markers.setdefault( linestyle, ( [], [] ) )
+        xys.append( ( pct, y ) )
+        kolors.append( kolor )
+
+    def bar( self, min_pct, max_pct, y, kolor, linewidth ):
+        if linewidth < self.bar_split:
+            segments, kolors, linewidths = self.thin_bars
+            segments.append( [ ( min_pct, y ), ( max_pct, y ) ] )
+            kolors.append( kolor )
+            linewidths.append( linewidth )
+        else:
+            y1, y2 = y-linewidth/2., y+linewidth/2.
+            polygons, kolors = self.thick_bars
+            polygons.append( [ ( min_pct, y1 ), ( max_pct, y1 ), ( max_pct, y2 ), ( min_pct, y2 ) ] )
+            kolors.append( kolor )
+
+    def connect( self, xys ):
+        if len( xys ) > 1:
+            self.connects.append( xys )
+
+    def draw( self, ax ):
+        # Styles are those < ax.plot > and < ax.fill > gave each artist singly.  The axes
+        # limits are set by the caller, so nothing here need autoscale.
+        polygons, kolors = self.thick_bars
+        if polygons:
+            ax.add_collection( matplotlib.collections.PolyCollection(
+                                   polygons, facecolors=kolors, edgecolors=kolors,
+                                   linewidths=matplotlib.rcParams['patch.linewidth'], zorder=self.zorder ),
+                               autolim=False )
+        for linestyle in ( PointRaw.linestyle, PointSmooth.linestyle ):     # Smooth on top
+            if linestyle in self.markers:
+                xys, kolors = self.markers[ linestyle ]
+                pcts, ys = zip( *xys )
+                ax.scatter( pcts, ys, s=matplotlib.rcParams['lines.markersize']**2, marker=linestyle,
+                            c=kolors, edgecolors=kolors,
+                            linewidths=matplotlib.rcParams['lines.markeredgewidth'], zorder=self.zorder )
+        segments, kolors, linewidths = self.thin_bars
+        if segments:
+            ax.add_collection( matplotlib.collections.LineCollection(
+                                   segments, colors=kolors, linewidths=linewidths,
+                                   capstyle=matplotlib.rcParams['lines.solid_capstyle'], zorder=self.zorder ),
+                               autolim=False )
+        if self.connects:
+            ax.add_collection( matplotlib.collections.LineCollection(
+                                   self.connects, colors='b', linewidths=matplotlib.rcParams['lines.linewidth'],
+                                   capstyle=matplotlib.rcParams['lines.solid_capstyle'],
+                                   joinstyle=matplotlib.rcParams['lines.solid_joinstyle'],
+                                   zorder=matplotlib.lines.Line2D.zorder ),
+                               autolim=False )
+
 class Point:
     forward_days = 5
-    def __init__( self, geo_series ):
+    def __init__( self, geo_series, extrapolated ):
+        # < extrapolated > is the exponential extrapolation of < geo_series >, from the
+        # batch fit in < Geostack >; None if it could not be fitted.
         self.geo_series = geo_series
-        back_days = self.geo_series.datalength()-1
-        self.extrapolated = None
+        self.extrapolated = extrapolated
         self.dub = None
         self.pct = None
-        if self.geo_series.datalength() > 2:  # Otherwise fitting a 2-parm model breaks
-            try:
-                self.extrapolated = self.geo_series.extrapolate( back_days, self.forward_days, exponential=True )
-                self.dub = self.extrapolated.extrapolation_doubling
-                self.pct = 0 if self.dub==0 else LN2x100 / self.dub
-            except RuntimeError:
-                pass
+        if self.extrapolated:
+            self.dub = self.extrapolated.extrapolation_doubling
+            self.pct = 0 if self.dub==0 else LN2x100 / self.dub
 
 class PointRaw( Point ):
     linestyle = 's'
@@ -172,6 +310,13 @@ class Stacklist:
     def __init__( self, stackobj_list ):
         self.stackobjs = stackobj_list
         self.stackobjs[-1].is_last = True
+
+    def as_data( self ):
+        # Everything < stacker0 > draws, for drawing it elsewhere, e.g. in a browser.
+        pct0, pct9, pd_pairs = self.pct_bounds()
+        return { 'pct_range': [ pct0, pct9 ],
+                 'ticks': [ [ pct, days ] for pct, days in pd_pairs ],
+                 'stacks': [ stack.as_data() for stack in self.stackobjs ] }
     
     def pct_bounds( self ):
         # Returns the xlim for the main "vertical" plot.
@@ -236,15 +381,17 @@ class Stacklist:
         return y0, y8, y9, solo_left, solo_width, y2inches, fig_ht_inches, axbar_pos
         
 
-def stackerX( sergeos, series_name, dataset_when, pathname ):
-    back_days = 14
-    forward_days = 10
+def stackerX( sergeos, series_name, dataset_when, pathname, workers=None ):
     #
-    # Create stack instance for each geo.  Determine # plotlines and extreme pcts.
+    # Create stack instance for each geo, in parallel if < workers > > 1 (see < map_geos >).
     #
-    stacklist = Stacklist( [ make_geostack( back_days, sergeo.diff() )
-                             for sergeo in sergeos ] )
-    return stacker0( {}, back_days, forward_days, series_name, stacklist, dataset_when, pathname )
+    stacks = map_geos( _geostack_job, [ ( BACK_DAYS, sergeo ) for sergeo in sergeos ], workers )
+    return stacker_of_stacks( stacks, series_name, dataset_when, pathname )
+
+def stacker_of_stacks( stacks, series_name, dataset_when, pathname ):
+    # Determine # plotlines and extreme pcts, and draw.
+    stacklist = Stacklist( stacks )
+    return stacker0( {}, BACK_DAYS, FORWARD_DAYS, series_name, stacklist, dataset_when, pathname )
 
 def stacker0( plotdict, back_days, forward_days, series_name, stacklist, dataset_when, pathname ):
     pct0, pct9, pd_pairs = stacklist.pct_bounds()
@@ -264,11 +411,12 @@ def stacker0( plotdict, back_days, forward_days, series_name, stacklist, dataset
         # Plot the layers for each geo into the "vertical" consolidated axes.
         # Also plot the "waveform" axes for each geo.
         #
+        artists = LayerArtists()
         for stack in stacks:
             util3.log( 'Stacker plot for:', stack.labeltxt )
             for pct, day in pd_pairs:
                 ax.text( pct, y_top+PIXELS_PER_PLOTLINE, '%dd' % abs(day), verticalalignment='center', horizontalalignment='center', zorder=99 )
-            y_bot = stack.plot_layers( ax, y_top, PIXELS_PER_PLOTLINE, series_denom )
+            y_bot = stack.plot_layers( ax, artists, y_top, PIXELS_PER_PLOTLINE, series_denom )
             solo_pos = ( solo_left, 
                          y2inches(y_bot+ PIXELS_PER_PLOTLINE)/fig_ht_inches, 
                          solo_width, 
@@ -276,6 +424,7 @@ def stacker0( plotdict, back_days, forward_days, series_name, stacklist, dataset
             ax2 = plot.fig.add_axes( solo_pos )
             stack.waveform( ax2 )                   # Waveform
             y_top = y_bot
+        artists.draw( ax )
         #
         # Set up the appurtenances for the overall plot.
         #